@@ -8,7 +8,12 @@ import re
 import threading
 import time
 import asyncio
+import atexit
+import collections
+import itertools
+import types
 from datetime import datetime, timedelta
+from bson import ObjectId
 from pyrogram import Client
 from pyrogram.errors import (
     PhoneNumberInvalid, PhoneCodeInvalid,
@@ -18,65 +23,62 @@ from pyrogram.errors import (
 
 logger = logging.getLogger(__name__)
 
+# Use the libuv based event loop for the loop thread when it is installed
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Unique in-process suffix for Pyrogram client names
+_name_counter = itertools.count()
+
 # Global event loop for async operations
 _global_event_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
 
 def get_event_loop():
-    """Get or create a global event loop"""
-    global _global_event_loop
+    """Get the global event loop, starting its background thread on first use"""
+    global _global_event_loop, _loop_thread
     if _global_event_loop is None:
-        _global_event_loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(_global_event_loop)
+        with _loop_lock:
+            if _global_event_loop is None:
+                loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+                _loop_thread = threading.Thread(
+                    target=loop.run_forever, name="account-event-loop", daemon=True
+                )
+                _loop_thread.start()
+                _global_event_loop = loop
+                atexit.register(_stop_event_loop)
     return _global_event_loop
 
+def _stop_event_loop():
+    """Stop the background event loop thread on interpreter exit"""
+    if _global_event_loop is not None and _global_event_loop.is_running():
+        _global_event_loop.call_soon_threadsafe(_global_event_loop.stop)
+        if _loop_thread is not None:
+            _loop_thread.join(timeout=5)
+
 # ---------------------------------------------------------------------
 # ASYNC MANAGEMENT
 # ---------------------------------------------------------------------
 
 class AsyncManager:
     """Manages async operations in sync context"""
-    def __init__(self):
+    __slots__ = ("lock", "loop")
+    
+    def __init__(self, loop=None):
         self.lock = threading.Lock()
+        # Resolved once, run_async never looks the loop up again
+        self.loop = loop or get_event_loop()
     
     def run_async(self, coro):
-        """Run async coroutine from sync context"""
+        """Run async coroutine from sync context on the shared loop thread"""
         try:
-            loop = get_event_loop()
-            # Check if we're in the event loop thread
-            if loop.is_running():
-                # Run in a new thread with its own event loop
-                return self._run_in_thread(coro)
-            else:
-                # Run in current event loop
-                return loop.run_until_complete(coro)
+            return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
         except Exception as e:
-            logger.error(f"Async operation failed: {e}")
+            logger.error("Async operation failed: %s", e)
             raise
-    
-    def _run_in_thread(self, coro):
-        """Run coroutine in a separate thread with its own event loop"""
-        result = None
-        exception = None
-        
-        def run():
-            nonlocal result, exception
-            try:
-                # Create new event loop for this thread
-                new_loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(new_loop)
-                result = new_loop.run_until_complete(coro)
-                new_loop.close()
-            except Exception as e:
-                exception = e
-        
-        # Run in thread
-        thread = threading.Thread(target=run)
-        thread.start()
-        thread.join()
-        
-        if exception:
-            raise exception
-        return result
 
 # ---------------------------------------------------------------------
 # PYROGRAM CLIENT MANAGER (FIXED)
@@ -84,6 +86,8 @@ class AsyncManager:
 
 class PyrogramClientManager:
     """Fixed Pyrogram client management without ping issues"""
+    __slots__ = ("api_id", "api_hash", "lock")
+    
     def __init__(self, api_id, api_hash):
         self.api_id = api_id
         self.api_hash = api_hash
@@ -92,7 +96,7 @@ class PyrogramClientManager:
     async def create_client(self, session_string=None, name=None):
         """Create a Pyrogram client with proper settings"""
         if name is None:
-            name = f"client_{int(time.time())}"
+            name = f"client_{next(_name_counter)}"
         
         # Create client with settings to avoid ping issues
         client = Client(
@@ -110,10 +114,8 @@ class PyrogramClientManager:
     async def send_code(self, client, phone_number):
         """Send verification code"""
         try:
-            # Disconnect first if already connected
-            if hasattr(client, 'is_connected') and client.is_connected:
-                await self.safe_disconnect(client)
-            
+            # Fresh client from create_client, connected once here and kept
+            # connected for sign-in and session export
             await client.connect()
             sent_code = await client.send_code(phone_number)
             return True, sent_code.phone_code_hash, None
@@ -125,10 +127,6 @@ class PyrogramClientManager:
     async def sign_in_with_otp(self, client, phone_number, phone_code_hash, otp_code):
         """Sign in with OTP"""
         try:
-            # Ensure client is connected
-            if not hasattr(client, 'is_connected') or not client.is_connected:
-                await client.connect()
-            
             await client.sign_in(
                 phone_number=phone_number,
                 phone_code=otp_code,
@@ -143,10 +141,6 @@ class PyrogramClientManager:
     async def sign_in_with_password(self, client, password):
         """Sign in with 2FA password"""
         try:
-            # Ensure client is connected
-            if not hasattr(client, 'is_connected') or not client.is_connected:
-                await client.connect()
-            
             await client.check_password(password)
             return True, None
         except Exception as e:
@@ -155,10 +149,6 @@ class PyrogramClientManager:
     async def get_session_string(self, client):
         """Get session string from authorized client"""
         try:
-            # Ensure client is connected
-            if not hasattr(client, 'is_connected') or not client.is_connected:
-                await client.connect()
-            
             # In Pyrogram v2, check authorization by getting "me"
             try:
                 me = await client.get_me()
@@ -168,10 +158,10 @@ class PyrogramClientManager:
                 else:
                     return None
             except Exception as e:
-                logger.error(f"User not authorized or error getting me: {e}")
+                logger.error("User not authorized or error getting me: %s", e)
                 return None
         except Exception as e:
-            logger.error(f"Error getting session string: {e}")
+            logger.error("Error getting session string: %s", e)
             return None
     
     async def safe_disconnect(self, client):
@@ -186,13 +176,95 @@ class PyrogramClientManager:
                         pass
                 await client.disconnect()
         except Exception as e:
-            logger.error(f"Error disconnecting client: {e}")
+            logger.error("Error disconnecting client: %s", e)
             # Ignore disconnection errors
 
+# One shared manager per API credentials: {(api_id, api_hash): manager}
+_managers = {}
+
+def get_manager(api_id, api_hash):
+    """Get the shared PyrogramClientManager for these API credentials"""
+    manager = _managers.get((api_id, api_hash))
+    if manager is None:
+        manager = _managers.setdefault((api_id, api_hash), PyrogramClientManager(api_id, api_hash))
+    return manager
+
 # ---------------------------------------------------------------------
 # ACCOUNT MANAGEMENT FUNCTIONS
 # ---------------------------------------------------------------------
 
+# Live login clients kept between login steps: {user_id: client}
+_login_clients = {}
+
+class _LoginSession:
+    """One login step; disconnects the client and drops state unless kept"""
+    __slots__ = ("login_states", "user_id", "state", "client", "api_id", "api_hash", "manager", "keep_alive")
+    
+    def __init__(self, login_states, user_id):
+        self.login_states = login_states
+        self.user_id = user_id
+        self.state = login_states.get(user_id)
+        self.client = _login_clients.get(user_id)
+        state = self.state or {}
+        self.api_id = state.get("api_id", 6435225)
+        self.api_hash = state.get("api_hash", "4e984ea35f854762dcde906dce426c2d")
+        self.manager = get_manager(self.api_id, self.api_hash)
+        self.keep_alive = False
+    
+    def keep(self):
+        """Keep client and state for the next login step"""
+        self.keep_alive = True
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None and self.keep_alive:
+            if self.client is not None:
+                _login_clients[self.user_id] = self.client
+            return False
+        
+        client = _login_clients.pop(self.user_id, None) or self.client
+        if client is not None:
+            await self.manager.safe_disconnect(client)
+        self.login_states.pop(self.user_id, None)
+        return False
+
+async def _finalize_and_save(sess, accounts_col, password=None):
+    """Export session of a signed-in login and save the account"""
+    # Get session string
+    session_string = await sess.manager.get_session_string(sess.client)
+    if not session_string:
+        return False, "Failed to get session string"
+    
+    state = sess.state
+    label = "2FA Account" if password is not None else "Account"
+    
+    # Save account to database
+    account_data = {
+        "country": state["country"],
+        "phone": state["phone"],
+        "session_string": session_string,
+        "has_2fa": password is not None,
+        "two_step_password": password,
+        "status": "active",
+        "used": False,
+        "created_at": datetime.utcnow(),
+        "created_by": sess.user_id,
+        "api_id": sess.api_id,
+        "api_hash": sess.api_hash
+    }
+    
+    # Insert account
+    if accounts_col is not None:
+        result = await asyncio.to_thread(accounts_col.insert_one, account_data)
+        logger.info("%s saved to database with ID: %s", label, result.inserted_id)
+    else:
+        logger.error("accounts_col is None, cannot save %s", label)
+    
+    # Disconnect and state cleanup happen when the login session exits
+    return True, "Account added successfully"
+
 async def pyrogram_login_flow_async(login_states, accounts_col, user_id, phone_number, chat_id, message_id, country, api_id, api_hash):
     """Async Pyrogram login flow for adding accounts"""
     try:
@@ -200,30 +272,32 @@ async def pyrogram_login_flow_async(login_states, accounts_col, user_id, phone_n
         if user_id not in login_states:
             return False, "Session expired"
         
-        manager = PyrogramClientManager(api_id, api_hash)
-        # Create client
-        client = await manager.create_client()
-        
-        # Send code
-        success, phone_code_hash, error = await manager.send_code(client, phone_number)
-        if success:
-            # Store client and state
-            login_states[user_id].update({
-                "client": client,
+        login_states[user_id].update({"api_id": api_id, "api_hash": api_hash})
+        async with _LoginSession(login_states, user_id) as sess:
+            # Drop client left over from an earlier attempt
+            if sess.client is not None:
+                _login_clients.pop(user_id, None)
+                await sess.manager.safe_disconnect(sess.client)
+            
+            # Create client
+            sess.client = await sess.manager.create_client()
+            
+            # Send code
+            success, phone_code_hash, error = await sess.manager.send_code(sess.client, phone_number)
+            if not success:
+                return False, error or "Failed to send OTP"
+            
+            # Keep client for the OTP step
+            sess.state.update({
                 "phone": phone_number,
                 "phone_code_hash": phone_code_hash,
                 "step": "waiting_otp",
-                "manager": manager,
-                "country": country,
-                "api_id": api_id,
-                "api_hash": api_hash
+                "country": country
             })
+            sess.keep()
             return True, "OTP sent successfully"
-        else:
-            await manager.safe_disconnect(client)
-            return False, error or "Failed to send OTP"
     except Exception as e:
-        logger.error(f"Pyrogram login error: {e}")
+        logger.error("Pyrogram login error: %s", e)
         return False, str(e)
 
 async def verify_otp_and_save_async(login_states, accounts_col, user_id, otp_code):
@@ -232,69 +306,28 @@ async def verify_otp_and_save_async(login_states, accounts_col, user_id, otp_cod
         if user_id not in login_states:
             return False, "Session expired"
         
-        state = login_states[user_id]
-        if "client" not in state:
-            return False, "Client not found"
-        
-        client = state["client"]
-        api_id = state.get("api_id", 6435225)
-        api_hash = state.get("api_hash", "4e984ea35f854762dcde906dce426c2d")
-        manager = state.get("manager") or PyrogramClientManager(api_id, api_hash)
-        
-        # Try to sign in with OTP
-        success, status, error = await manager.sign_in_with_otp(
-            client, state["phone"], state["phone_code_hash"], otp_code
-        )
-        
-        if status == "password_required":
-            # 2FA required
-            login_states[user_id]["step"] = "waiting_password"
-            return False, "password_required"
-        
-        if not success:
-            await manager.safe_disconnect(client)
-            login_states.pop(user_id, None)
-            return False, error or "OTP verification failed"
-        
-        # Get session string
-        session_string = await manager.get_session_string(client)
-        if not session_string:
-            await manager.safe_disconnect(client)
-            login_states.pop(user_id, None)
-            return False, "Failed to get session string"
-        
-        # Save account to database
-        account_data = {
-            "country": state["country"],
-            "phone": state["phone"],
-            "session_string": session_string,
-            "has_2fa": False,
-            "two_step_password": None,
-            "status": "active",
-            "used": False,
-            "created_at": datetime.utcnow(),
-            "created_by": user_id,
-            "api_id": api_id,
-            "api_hash": api_hash
-        }
-        
-        # Insert account
-        if accounts_col is not None:
-            result = accounts_col.insert_one(account_data)
-            logger.info(f"Account saved to database with ID: {result.inserted_id}")
-        else:
-            logger.error("accounts_col is None, cannot save account")
-        
-        # Cleanup
-        await manager.safe_disconnect(client)
-        login_states.pop(user_id, None)
-        return True, "Account added successfully"
+        async with _LoginSession(login_states, user_id) as sess:
+            state = sess.state
+            if sess.client is None:
+                return False, "Client not found"
+            
+            # Try to sign in with OTP
+            success, status, error = await sess.manager.sign_in_with_otp(
+                sess.client, state["phone"], state["phone_code_hash"], otp_code
+            )
+            
+            if status == "password_required":
+                # 2FA required, keep client for the password step
+                state["step"] = "waiting_password"
+                sess.keep()
+                return False, "password_required"
+            
+            if not success:
+                return False, error or "OTP verification failed"
+            
+            return await _finalize_and_save(sess, accounts_col)
     except Exception as e:
-        logger.error(f"OTP verification error: {e}")
-        if user_id in login_states and "client" in login_states[user_id]:
-            manager = login_states[user_id].get("manager") or PyrogramClientManager(api_id=6435225, api_hash="4e984ea35f854762dcde906dce426c2d")
-            await manager.safe_disconnect(login_states[user_id]["client"])
-            login_states.pop(user_id, None)
+        logger.error("OTP verification error: %s", e)
         return False, str(e)
 
 async def verify_2fa_password_async(login_states, accounts_col, user_id, password):
@@ -303,73 +336,90 @@ async def verify_2fa_password_async(login_states, accounts_col, user_id, passwor
         if user_id not in login_states:
             return False, "Session expired"
         
-        state = login_states[user_id]
-        if "client" not in state:
-            return False, "Client not found"
-        
-        client = state["client"]
-        api_id = state.get("api_id", 6435225)
-        api_hash = state.get("api_hash", "4e984ea35f854762dcde906dce426c2d")
-        manager = state.get("manager") or PyrogramClientManager(api_id, api_hash)
-        
-        # Check password
-        success, error = await manager.sign_in_with_password(client, password)
-        if not success:
-            await manager.safe_disconnect(client)
-            return False, error
-        
-        # Get session string
-        session_string = await manager.get_session_string(client)
-        if not session_string:
-            await manager.safe_disconnect(client)
-            login_states.pop(user_id, None)
-            return False, "Failed to get session string"
-        
-        # Save account to database
-        account_data = {
-            "country": state["country"],
-            "phone": state["phone"],
-            "session_string": session_string,
-            "has_2fa": True,
-            "two_step_password": password,
-            "status": "active",
-            "used": False,
-            "created_at": datetime.utcnow(),
-            "created_by": user_id,
-            "api_id": api_id,
-            "api_hash": api_hash
-        }
-        
-        # Insert account
-        if accounts_col is not None:
-            result = accounts_col.insert_one(account_data)
-            logger.info(f"2FA Account saved to database with ID: {result.inserted_id}")
-        else:
-            logger.error("accounts_col is None, cannot save 2FA account")
-        
-        # Cleanup
-        await manager.safe_disconnect(client)
-        login_states.pop(user_id, None)
-        return True, "Account added successfully"
+        async with _LoginSession(login_states, user_id) as sess:
+            if sess.client is None:
+                return False, "Client not found"
+            
+            # Check password
+            success, error = await sess.manager.sign_in_with_password(sess.client, password)
+            if not success:
+                return False, error
+            
+            return await _finalize_and_save(sess, accounts_col, password)
     except Exception as e:
-        logger.error(f"2FA verification error: {e}")
-        if user_id in login_states and "client" in login_states[user_id]:
-            manager = login_states[user_id].get("manager") or PyrogramClientManager(api_id=6435225, api_hash="4e984ea35f854762dcde906dce426c2d")
-            await manager.safe_disconnect(login_states[user_id]["client"])
-            login_states.pop(user_id, None)
+        logger.error("2FA verification error: %s", e)
         return False, str(e)
 
+async def cancel_login_async(login_states, user_id):
+    """Cancel a login in progress, disconnecting its client"""
+    async with _LoginSession(login_states, user_id):
+        pass
+
 # ---------------------------------------------------------------------
 # BULK ACCOUNT FUNCTIONS (NEW)
 # ---------------------------------------------------------------------
 
+class _InsertBatcher:
+    """Collects documents for one collection and writes them with insert_many"""
+    def __init__(self, collection, max_batch=100):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue()
+        self.task = None
+    
+    async def insert(self, document):
+        """Queue document and wait until its batch is written, returns inserted id"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        await self.queue.put((document, future))
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self._run())
+        return await future
+    
+    async def _run(self):
+        """Write whatever is queued at once, documents queued meanwhile form the next batch"""
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty() and len(batch) < self.max_batch:
+                batch.append(self.queue.get_nowait())
+            
+            documents = [document for document, _ in batch]
+            failed = {}
+            try:
+                await asyncio.to_thread(self.collection.insert_many, documents, ordered=False)
+            except Exception as e:
+                # BulkWriteError lists failed documents, anything else fails the whole batch
+                details = getattr(e, "details", None) or {}
+                write_errors = details.get("writeErrors")
+                if write_errors:
+                    failed = {err["index"]: e for err in write_errors}
+                else:
+                    failed = {index: e for index in range(len(batch))}
+            
+            for index, (document, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if index in failed:
+                    future.set_exception(failed[index])
+                else:
+                    future.set_result(document.get("_id"))
+
+_insert_batchers = {}
+
+def _get_insert_batcher(collection):
+    """Get the insert batcher for collection, creating it on first use"""
+    batcher = _insert_batchers.get(collection)
+    if batcher is None:
+        batcher = _insert_batchers[collection] = _InsertBatcher(collection)
+    return batcher
+
 async def bulk_send_code_async(phone_number, api_id, api_hash, client_name=None):
     """Send OTP code for bulk processing"""
     try:
-        manager = PyrogramClientManager(api_id, api_hash)
+        manager = get_manager(api_id, api_hash)
         
         if client_name is None:
-            client_name = f"bulk_{int(time.time())}_{phone_number[-4:]}"
+            client_name = f"bulk_{next(_name_counter)}_{phone_number[-4:]}"
         
         client = await manager.create_client(name=client_name)
         success, phone_code_hash, error = await manager.send_code(client, phone_number)
@@ -389,13 +439,31 @@ async def bulk_send_code_async(phone_number, api_id, api_hash, client_name=None)
                 "client": None
             }
     except Exception as e:
-        logger.error(f"Bulk send code error for {phone_number}: {e}")
+        logger.error("Bulk send code error for %s: %s", phone_number, e)
         return {
             "success": False,
             "error": str(e),
             "client": None
         }
 
+async def bulk_send_code_many_async(phone_numbers, api_id, api_hash, concurrency=20):
+    """Send OTP codes to many numbers concurrently, results in input order"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def send_one(phone_number):
+        async with semaphore:
+            return await bulk_send_code_async(phone_number, api_id, api_hash)
+    
+    results = await asyncio.gather(
+        *[send_one(phone_number) for phone_number in phone_numbers],
+        return_exceptions=True
+    )
+    return [
+        {"success": False, "error": str(result), "client": None}
+        if isinstance(result, BaseException) else result
+        for result in results
+    ]
+
 async def bulk_verify_otp_async(client, phone_number, phone_code_hash, otp_code, manager):
     """Verify OTP for bulk processing"""
     try:
@@ -410,7 +478,7 @@ async def bulk_verify_otp_async(client, phone_number, phone_code_hash, otp_code,
         else:
             return {"success": False, "status": "error", "error": error}
     except Exception as e:
-        logger.error(f"Bulk OTP verification error: {e}")
+        logger.error("Bulk OTP verification error: %s", e)
         return {"success": False, "status": "error", "error": str(e)}
 
 async def bulk_verify_password_async(client, password, manager):
@@ -419,7 +487,7 @@ async def bulk_verify_password_async(client, password, manager):
         success, error = await manager.sign_in_with_password(client, password)
         return {"success": success, "error": error}
     except Exception as e:
-        logger.error(f"Bulk password verification error: {e}")
+        logger.error("Bulk password verification error: %s", e)
         return {"success": False, "error": str(e)}
 
 async def bulk_save_account_async(client, phone_number, country, user_id, manager, accounts_col, password=None):
@@ -447,94 +515,199 @@ async def bulk_save_account_async(client, phone_number, country, user_id, manage
         
         # Insert account
         if accounts_col is not None:
-            result = accounts_col.insert_one(account_data)
-            logger.info(f"Bulk account saved: {phone_number} with ID: {result.inserted_id}")
+            # Concurrent bulk saves share one insert_many round trip
+            inserted_id = await _get_insert_batcher(accounts_col).insert(account_data)
+            logger.info("Bulk account saved: %s with ID: %s", phone_number, inserted_id)
             return True, "Account saved"
         else:
             return False, "Database collection not available"
     except Exception as e:
-        logger.error(f"Bulk save account error: {e}")
+        logger.error("Bulk save account error: %s", e)
         return False, str(e)
 
+# Bulk operation name -> (coroutine, result shape on failure)
+_BULK_OPS = types.MappingProxyType({
+    "verify_otp": (bulk_verify_otp_async, lambda e: {"success": False, "status": "error", "error": str(e)}),
+    "verify_password": (bulk_verify_password_async, lambda e: {"success": False, "error": str(e)}),
+    "save_account": (bulk_save_account_async, lambda e: (False, str(e))),
+})
+
+async def bulk_many_async(ops):
+    """Run a list of (kind, args) bulk operations concurrently"""
+    results = await asyncio.gather(
+        *(_BULK_OPS[kind][0](*args) for kind, args in ops),
+        return_exceptions=True
+    )
+    for i, ((kind, _), result) in enumerate(zip(ops, results)):
+        if isinstance(result, Exception):
+            logger.error("Bulk %s error: %s", kind, result)
+            results[i] = _BULK_OPS[kind][1](result)
+    return results
+
+# ---------------------------------------------------------------------
+# PYROGRAM CLIENT POOL - REUSE CONNECTED SESSIONS
+# ---------------------------------------------------------------------
+
+# Connected clients keyed by session string, least recently used first:
+# {session_string: (client, last_used)}
+# Only touched from the loop thread and never across an await, so it needs
+# no lock of its own
+_client_pool = collections.OrderedDict()
+# Per-session locks so concurrent misses for one session connect once,
+# while misses for different sessions connect in parallel:
+# {session_string: [lock, callers holding or waiting on it]}
+_connect_locks = {}
+_pool_reaper_task = None
+
+# Upper bound on connected pooled clients
+CLIENT_POOL_MAX_SIZE = 256
+# Telegram drops idle connections after ~30 minutes, so close them a bit earlier
+CLIENT_IDLE_TIMEOUT = 25 * 60
+CLIENT_REAP_INTERVAL = 60
+
+async def _disconnect_pooled(client):
+    """Disconnect a client that left the pool"""
+    await get_manager(client.api_id, client.api_hash).safe_disconnect(client)
+
+def _pooled_client(session_string):
+    """Return the connected pooled client for session and mark it used, or None"""
+    entry = _client_pool.get(session_string)
+    if entry and entry[0].is_connected:
+        _client_pool[session_string] = (entry[0], time.time())
+        _client_pool.move_to_end(session_string)
+        return entry[0]
+    return None
+
+async def acquire_client(session_string, api_id=6435225, api_hash="4e984ea35f854762dcde906dce426c2d"):
+    """Get a connected client for session, connecting only on a pool miss"""
+    global _pool_reaper_task
+    client = _pooled_client(session_string)
+    if client is not None:
+        return client
+    
+    entry = _connect_locks.setdefault(session_string, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            # Another caller may have connected while we waited
+            client = _pooled_client(session_string)
+            if client is not None:
+                return client
+            
+            # The session string already carries the auth key, so an
+            # in-memory client connects without a new key exchange
+            client = Client(
+                f"otp_{hash(session_string) & 0xffffffff:x}",
+                session_string=session_string,
+                api_id=int(api_id),
+                api_hash=api_hash,
+                in_memory=True,
+                no_updates=True,
+                sleep_threshold=0
+            )
+            await client.connect()
+            
+            # A dropped connection for this session is replaced, not leaked
+            stale = _client_pool.pop(session_string, None)
+            if stale:
+                asyncio.get_running_loop().create_task(_disconnect_pooled(stale[0]))
+            # Make room by dropping the least recently used client
+            while len(_client_pool) >= CLIENT_POOL_MAX_SIZE:
+                _, (old_client, _) = _client_pool.popitem(last=False)
+                asyncio.get_running_loop().create_task(_disconnect_pooled(old_client))
+            _client_pool[session_string] = (client, time.time())
+    finally:
+        # Drop the lock only once no caller holds or waits on it
+        entry[1] -= 1
+        if entry[1] == 0:
+            _connect_locks.pop(session_string, None)
+    
+    if _pool_reaper_task is None or _pool_reaper_task.done():
+        _pool_reaper_task = asyncio.get_running_loop().create_task(_reap_idle_clients())
+    return client
+
+async def evict_client(session_string):
+    """Remove client from pool and disconnect it"""
+    entry = _client_pool.pop(session_string, None)
+    if entry:
+        await _disconnect_pooled(entry[0])
+
+async def _reap_idle_clients():
+    """Periodically disconnect pooled clients that have been idle too long"""
+    while True:
+        await asyncio.sleep(CLIENT_REAP_INTERVAL)
+        now = time.time()
+        idle = [key for key, (_, last_used) in list(_client_pool.items())
+                if now - last_used > CLIENT_IDLE_TIMEOUT]
+        for key in idle:
+            await evict_client(key)
+        if idle:
+            logger.info("Closed %s idle pooled client(s)", len(idle))
+
 # ---------------------------------------------------------------------
 # IMPROVED OTP SEARCHER FUNCTION - ALWAYS GETS LATEST OTP
 # ---------------------------------------------------------------------
 
+# Use the DFA based re2 engine for the OTP scan when it is installed
+try:
+    import re2 as _otp_re_engine
+except ImportError:
+    _otp_re_engine = re
+
+# 5 digit login codes and the words Telegram uses around them. re2's \b and
+# \d are ASCII only, so the stdlib fallback is held to ASCII to match
+if _otp_re_engine is re:
+    _OTP_RE = re.compile(r'\b\d{5}\b', re.ASCII)
+else:
+    _OTP_RE = _otp_re_engine.compile(r'\b\d{5}\b')
+_OTP_KEYWORDS = ("code", "login", "verification", "رمز", "تأكيد")
+
+async def _scan_chat_for_otp(client, chat_id, min_message_id=0, limit=10):
+    """Return (otp, timestamp) of the newest OTP message in chat, or None"""
+    # History is newest-first, so the first matching message is the latest OTP
+    async for message in client.get_chat_history(chat_id, limit=limit):
+        if message.id <= min_message_id:
+            # Older than what the caller has already seen
+            break
+        text = message.text
+        if not text:
+            continue
+        low = text.lower()
+        if not any(keyword in low for keyword in _OTP_KEYWORDS):
+            continue
+        m = _OTP_RE.search(text)
+        if not m:
+            continue
+        return m.group(0), message.date.timestamp() if message.date else 0
+    return None
+
 async def otp_searcher(session_string, api_id=6435225, api_hash="4e984ea35f854762dcde906dce426c2d", last_message_id=None):
     """Search for LATEST OTP in Telegram messages - returns latest OTP only"""
-    client = None
     try:
-        # Create client with specific name
-        client = Client(
-            "otp_searcher_" + str(time.time()),
-            session_string=session_string,
-            api_id=int(api_id),
-            api_hash=api_hash,
-            in_memory=True,
-            no_updates=True,
-            sleep_threshold=0
-        )
-        
-        await client.connect()
+        # Reuse pooled connection for this session
+        client = await acquire_client(session_string, api_id, api_hash)
+        min_message_id = last_message_id or 0
         latest_otp = None
-        otp_time = None
-        message_count = 0
         
         try:
-            # Get last 50 messages from "Telegram" chat
-            async for message in client.get_chat_history("Telegram", limit=50):
-                message_count += 1
-                if message.text and any(keyword in message.text.lower() for keyword in ["code", "login", "verification", "رمز", "تأكيد"]):
-                    # Pattern for OTP codes
-                    pattern = r'\b\d{5}\b'  # 5 digit codes
-                    matches = re.findall(pattern, message.text)
-                    for match in matches:
-                        # Always take the first match (most recent due to chat history order)
-                        if message.date:
-                            current_time = message.date.timestamp()
-                            # Always update if we find any OTP (take the most recent)
-                            if latest_otp is None or current_time > otp_time:
-                                otp_time = current_time
-                                latest_otp = match
-                                logger.info(f"Found OTP in message: {match} at {message.date}")
-                            break  # First match is enough
-                    # Don't break - continue searching for more recent messages
-                    # But if we found one, we'll keep looking for newer ones
-                    
-            # If not found in Telegram chat, check 777000
-            if not latest_otp:
-                async for message in client.get_chat_history(777000, limit=50):
-                    if message.text and any(keyword in message.text.lower() for keyword in ["code", "login", "verification"]):
-                        pattern = r'\b\d{5}\b'
-                        matches = re.findall(pattern, message.text)
-                        for match in matches:
-                            if message.date:
-                                current_time = message.date.timestamp()
-                                if latest_otp is None or current_time > otp_time:
-                                    otp_time = current_time
-                                    latest_otp = match
-                                    logger.info(f"Found OTP from 777000: {match} at {message.date}")
-                                break
-                        # Don't break - keep searching
+            # Scan "Telegram" chat and 777000 at the same time, newest hit wins
+            results = await asyncio.gather(
+                _scan_chat_for_otp(client, "Telegram", min_message_id),
+                _scan_chat_for_otp(client, 777000, min_message_id)
+            )
+            hits = [result for result in results if result]
+            if hits:
+                latest_otp = max(hits, key=lambda hit: hit[1])[0]
         except Exception as e:
-            logger.error(f"Error searching OTP in chat: {e}")
-        
-        # Safe disconnect
-        if client:
-            try:
-                await client.disconnect()
-            except:
-                pass
+            logger.error("Error searching OTP in chat: %s", e)
+            # Drop possibly broken connection, next call reconnects
+            await evict_client(session_string)
         
-        logger.info(f"OTP search completed. Messages checked: {message_count}, Found OTP: {latest_otp}")
+        logger.info("OTP search completed. Found OTP: %s", latest_otp)
         return latest_otp  # Return single latest OTP
     except Exception as e:
-        logger.error(f"OTP searcher error: {e}")
-        if client:
-            try:
-                await client.disconnect()
-            except:
-                pass
+        logger.error("OTP searcher error: %s", e)
+        await evict_client(session_string)
         return None
 
 # ---------------------------------------------------------------------
@@ -544,14 +717,16 @@ async def otp_searcher(session_string, api_id=6435225, api_hash="4e984ea35f85476
 async def logout_session_async(session_id, user_id, otp_sessions_col, accounts_col, orders_col):
     """Logout from session and mark order as completed"""
     try:
-        from bson import ObjectId
-        
         # Check if collections are not None
         if otp_sessions_col is None:
             return False, "otp_sessions_col is None"
         
         # Find session data
-        session_data = otp_sessions_col.find_one({"session_id": session_id})
+        session_data = await asyncio.to_thread(
+            otp_sessions_col.find_one,
+            {"session_id": session_id},
+            {"user_id": 1, "account_id": 1, "_id": 0}
+        )
         if not session_data:
             return False, "Session not found"
         
@@ -559,62 +734,79 @@ async def logout_session_async(session_id, user_id, otp_sessions_col, accounts_c
         if session_data.get("user_id") != user_id:
             return False, "Not authorized to logout this session"
         
-        # Update session status
-        otp_sessions_col.update_one(
+        now = datetime.utcnow()
+        
+        account_id = session_data.get("account_id")
+        try:
+            account_oid = ObjectId(account_id) if account_id else None
+        except Exception:
+            account_oid = None
+        
+        async def mark_account_used():
+            # Mark account used and fetch it for the Telegram logout below
+            try:
+                return await asyncio.to_thread(
+                    accounts_col.find_one_and_update,
+                    {"_id": account_oid},
+                    {"$set": {"used": True, "used_at": now}}
+                )
+            except Exception:
+                return None
+        
+        # The writes touch different collections, so run them side by side
+        writes = [asyncio.to_thread(
+            otp_sessions_col.update_one,
             {"session_id": session_id},
             {"$set": {
                 "status": "completed",
-                "completed_at": datetime.utcnow(),
+                "completed_at": now,
                 "completed_by_user": True
             }}
-        )
+        )]
         
         # Update order status only if orders_col is not None
         if orders_col is not None:
-            orders_col.update_one(
+            writes.append(asyncio.to_thread(
+                orders_col.update_one,
                 {"session_id": session_id},
                 {"$set": {
                     "status": "completed",
-                    "completed_at": datetime.utcnow(),
+                    "completed_at": now,
                     "user_completed": True
                 }}
-            )
+            ))
         
         # Mark account as used only if accounts_col is not None
-        account_id = session_data.get("account_id")
-        if account_id and accounts_col is not None:
-            try:
-                # mark account used
-                accounts_col.update_one(
-                    {"_id": ObjectId(account_id)},
-                    {"$set": {"used": True, "used_at": datetime.utcnow()}}
-                )
-            except:
-                pass
+        has_account = account_oid is not None and accounts_col is not None
+        if has_account:
+            writes.append(mark_account_used())
+        
+        results = await asyncio.gather(*writes)
+        account = results[-1] if has_account else None
         
         # 🔥 REAL TELEGRAM LOGOUT (CPython / Telegram X remove)
         try:
-            account = accounts_col.find_one({"_id": ObjectId(account_id)})
             if account and account.get("session_string"):
-                tg_client = Client(
-                    name=f"logout_{session_id}",
-                    session_string=account["session_string"],
-                    api_id=int(account.get("api_id", 6435225)),
-                    api_hash=account.get("api_hash", "4e984ea35f854762dcde906dce426c2d"),
-                    in_memory=True,
-                    no_updates=True
+                session_string = account["session_string"]
+                tg_client = await acquire_client(
+                    session_string,
+                    account.get("api_id", 6435225),
+                    account.get("api_hash", "4e984ea35f854762dcde906dce426c2d")
                 )
-                await tg_client.connect()
-                await tg_client.log_out()  # ✅ REAL LOGOUT
-                await tg_client.disconnect()
-                logger.info(f"Telegram account FORCE logged out for {account.get('phone')}")
+                try:
+                    await tg_client.log_out()  # ✅ REAL LOGOUT
+                finally:
+                    # Session is dead after logout, never hand it out again
+                    await evict_client(session_string)
+                logger.info("Telegram account FORCE logged out for %s", account.get('phone'))
         except Exception as e:
-            logger.error(f"Telegram logout failed: {e}")
+            logger.error("Telegram logout failed: %s", e)
         
-        logger.info(f"User {user_id} logged out from session {session_id}")
+        stop_otp_monitor(session_id)
+        logger.info("User %s logged out from session %s", user_id, session_id)
         return True, "Logged out successfully from Telegram"
     except Exception as e:
-        logger.error(f"Logout error: {e}")
+        logger.error("Logout error: %s", e)
         return False, str(e)
 
 # ---------------------------------------------------------------------
@@ -624,12 +816,12 @@ async def logout_session_async(session_id, user_id, otp_sessions_col, accounts_c
 async def get_latest_otp_async(session_string, api_id=6435225, api_hash="4e984ea35f854762dcde906dce426c2d"):
     """Get the latest OTP from session (for Get OTP button) - ALWAYS FETCH NEW"""
     try:
-        logger.info(f"Getting latest OTP for session...")
+        logger.info("Getting latest OTP for session...")
         # Always fetch new OTP, don't use cached
         latest_otp = await otp_searcher(session_string, api_id, api_hash)
         return latest_otp
     except Exception as e:
-        logger.error(f"Error getting latest OTP: {e}")
+        logger.error("Error getting latest OTP: %s", e)
         return None
 
 # ---------------------------------------------------------------------
@@ -644,56 +836,126 @@ async def get_otp_from_database_async(session_id, otp_sessions_col):
             return None
         
         # Directly fetch from database
-        session_data = otp_sessions_col.find_one({"session_id": session_id})
+        session_data = await asyncio.to_thread(
+            otp_sessions_col.find_one,
+            {"session_id": session_id},
+            {"last_otp": 1, "last_otp_time": 1, "_id": 0}
+        )
         if session_data and session_data.get("last_otp"):
             otp_code = session_data.get("last_otp")
             otp_time = session_data.get("last_otp_time")
             
             # Check if OTP is from last 5 minutes (300 seconds)
             if otp_time and (datetime.utcnow() - otp_time).total_seconds() < 300:
-                logger.info(f"Recent OTP fetched from database for session {session_id}: {otp_code}")
+                logger.info("Recent OTP fetched from database for session %s: %s", session_id, otp_code)
                 return otp_code
             else:
-                logger.info(f"OTP in database is too old for session {session_id}, will fetch new")
+                logger.info("OTP in database is too old for session %s, will fetch new", session_id)
                 return None
         else:
-            logger.warning(f"No OTP found in database for session {session_id}")
+            logger.warning("No OTP found in database for session %s", session_id)
             return None
     except Exception as e:
-        logger.error(f"Error getting OTP from database: {e}")
+        logger.error("Error getting OTP from database: %s", e)
         return None
 
 # ---------------------------------------------------------------------
 # SIMPLE OTP MONITORING (NON-AUTOMATIC)
 # ---------------------------------------------------------------------
 
+# Stop events for running monitors: {session_id: asyncio.Event}
+_monitors = {}
+
+def stop_otp_monitor(session_id):
+    """Wake up and end the monitor for session, if one is running"""
+    stop_event = _monitors.get(session_id)
+    if stop_event is not None:
+        stop_event.set()
+
 async def simple_otp_monitor(session_string, session_id, max_wait_time=1800, api_id=6435225, api_hash="4e984ea35f854762dcde906dce426c2d"):
     """Simple OTP monitoring without automatic notifications"""
-    start_time = time.time()
+    stop_event = _monitors.setdefault(session_id, asyncio.Event())
     
-    logger.info(f"Simple OTP monitoring started for session {session_id}")
-    while time.time() - start_time < max_wait_time:
-        try:
-            # Just keep the session alive, don't search for OTP automatically
-            await asyncio.sleep(10)
-        except Exception as e:
-            logger.error(f"Simple monitor error: {e}")
-            await asyncio.sleep(10)
+    logger.info("Simple OTP monitoring started for session %s", session_id)
+    try:
+        # Just keep the session alive until timeout or logout, don't search for OTP automatically
+        await asyncio.wait_for(stop_event.wait(), timeout=max_wait_time)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        _monitors.pop(session_id, None)
     
-    logger.info(f"Simple OTP monitoring ended for session {session_id}")
+    logger.info("Simple OTP monitoring ended for session %s", session_id)
     return None
 
 # ---------------------------------------------------------------------
 # SYNC WRAPPERS FOR ASYNC FUNCTIONS
 # ---------------------------------------------------------------------
 
+def _sync_wrapper(async_fn, label, on_error, doc):
+    """Build an AccountManager method that runs async_fn on the loop thread
+    
+    Exceptions are logged as "<label>: <error>" and turned into the
+    wrapper's failure result with on_error(e).
+    """
+    def wrapper(self, *args, **kwargs):
+        try:
+            return self.async_manager.run_async(async_fn(*args, **kwargs))
+        except Exception as e:
+            logger.error("%s: %s", label, e)
+            return on_error(e)
+    wrapper.__name__ = async_fn.__name__[:-len("_async")] + "_sync"
+    wrapper.__doc__ = doc
+    return wrapper
+
+def _fail_tuple(e):
+    return False, str(e)
+
+class _TTLCache:
+    """Small thread-safe cache whose entries expire after ttl seconds"""
+    __slots__ = ("ttl", "max_size", "entries", "lock")
+    
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        # {key: (value, stored_at)}, oldest first
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        """Return the cached value if younger than ttl, else None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[1] > self.ttl:
+                del self.entries[key]
+                return None
+            return entry[0]
+    
+    def put(self, key, value):
+        """Store value, dropping the oldest entries past max_size"""
+        with self.lock:
+            self.entries[key] = (value, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+# OTPs found in the last few seconds, keyed by ("latest", session_string)
+# or ("db", session_id)
+_otp_cache = _TTLCache(ttl=3, max_size=1024)
+# Successful logouts keyed by (session_id, user_id), so retries skip MongoDB
+_logout_cache = _TTLCache(ttl=60, max_size=4096)
+
 class AccountManager:
     """Main account manager class"""
+    __slots__ = ("api_id", "api_hash", "async_manager", "pyrogram_manager")
+    
     def __init__(self, api_id=6435225, api_hash="4e984ea35f854762dcde906dce426c2d"):
         self.api_id = api_id
         self.api_hash = api_hash
         self.async_manager = AsyncManager()
-        self.pyrogram_manager = PyrogramClientManager(api_id, api_hash)
+        self.pyrogram_manager = get_manager(api_id, api_hash)
     
     def pyrogram_login_flow_sync(self, login_states, accounts_col, user_id, phone_number, chat_id, message_id, country):
         """Sync wrapper for async login flow"""
@@ -705,28 +967,34 @@ class AccountManager:
                 )
             )
         except Exception as e:
-            logger.error(f"Login flow error: {e}")
+            logger.error("Login flow error: %s", e)
             return False, str(e)
     
-    def verify_otp_and_save_sync(self, login_states, accounts_col, user_id, otp_code):
-        """Sync wrapper for async OTP verification"""
-        try:
-            return self.async_manager.run_async(
-                verify_otp_and_save_async(login_states, accounts_col, user_id, otp_code)
-            )
-        except Exception as e:
-            logger.error(f"OTP verification error: {e}")
-            return False, str(e)
+    verify_otp_and_save_sync = _sync_wrapper(
+        verify_otp_and_save_async, "OTP verification error", _fail_tuple,
+        "Sync wrapper for async OTP verification"
+    )
     
-    def verify_2fa_password_sync(self, login_states, accounts_col, user_id, password):
-        """Sync wrapper for async 2FA verification"""
+    verify_2fa_password_sync = _sync_wrapper(
+        verify_2fa_password_async, "2FA verification error", _fail_tuple,
+        "Sync wrapper for async 2FA verification"
+    )
+    
+    def cancel_login_sync(self, login_states, user_id):
+        """Sync wrapper to cancel a login in progress"""
         try:
             return self.async_manager.run_async(
-                verify_2fa_password_async(login_states, accounts_col, user_id, password)
+                cancel_login_async(login_states, user_id)
             )
         except Exception as e:
-            logger.error(f"2FA verification error: {e}")
-            return False, str(e)
+            logger.error("Cancel login error: %s", e)
+            login_states.pop(user_id, None)
+    
+    def disconnect_client_background(self, client):
+        """Disconnect a client on the account loop without waiting for it"""
+        return asyncio.run_coroutine_threadsafe(
+            self.pyrogram_manager.safe_disconnect(client), self.async_manager.loop
+        )
     
     # -----------------------------------------------------------------
     # BULK ACCOUNT SYNC WRAPPERS (NEW)
@@ -741,99 +1009,180 @@ class AccountManager:
                 bulk_send_code_async(phone_number, api_id, api_hash)
             )
         except Exception as e:
-            logger.error(f"Bulk send code error: {e}")
+            logger.error("Bulk send code error: %s", e)
             return {"success": False, "error": str(e)}
     
-    def bulk_verify_otp_sync(self, client, phone_number, phone_code_hash, otp_code, manager):
-        """Sync wrapper for bulk OTP verification"""
+    def bulk_send_code_many_sync(self, phone_numbers, api_id=None, api_hash=None, concurrency=20):
+        """Sync wrapper for concurrent bulk send code"""
         try:
+            api_id = api_id or self.api_id
+            api_hash = api_hash or self.api_hash
             return self.async_manager.run_async(
-                bulk_verify_otp_async(client, phone_number, phone_code_hash, otp_code, manager)
+                bulk_send_code_many_async(phone_numbers, api_id, api_hash, concurrency)
             )
         except Exception as e:
-            logger.error(f"Bulk OTP verification error: {e}")
-            return {"success": False, "status": "error", "error": str(e)}
+            logger.error("Bulk send code error: %s", e)
+            return [{"success": False, "error": str(e), "client": None} for _ in phone_numbers]
     
-    def bulk_verify_password_sync(self, client, password, manager):
-        """Sync wrapper for bulk password verification"""
-        try:
-            return self.async_manager.run_async(
-                bulk_verify_password_async(client, password, manager)
-            )
-        except Exception as e:
-            logger.error(f"Bulk password verification error: {e}")
-            return {"success": False, "error": str(e)}
+    def bulk_send_code_background(self, phone_number, api_id=None, api_hash=None):
+        """Start sending a bulk OTP code, returns a future with the bulk_send_code_sync result"""
+        api_id = api_id or self.api_id
+        api_hash = api_hash or self.api_hash
+        return asyncio.run_coroutine_threadsafe(
+            bulk_send_code_async(phone_number, api_id, api_hash), self.async_manager.loop
+        )
     
-    def bulk_save_account_sync(self, client, phone_number, country, user_id, manager, accounts_col, password=None):
-        """Sync wrapper for bulk save account"""
+    bulk_verify_otp_sync = _sync_wrapper(
+        bulk_verify_otp_async, "Bulk OTP verification error",
+        lambda e: {"success": False, "status": "error", "error": str(e)},
+        "Sync wrapper for bulk OTP verification"
+    )
+    
+    bulk_verify_password_sync = _sync_wrapper(
+        bulk_verify_password_async, "Bulk password verification error",
+        lambda e: {"success": False, "error": str(e)},
+        "Sync wrapper for bulk password verification"
+    )
+    
+    bulk_save_account_sync = _sync_wrapper(
+        bulk_save_account_async, "Bulk save account error", _fail_tuple,
+        "Sync wrapper for bulk save account"
+    )
+    
+    def bulk_many_sync(self, ops):
+        """Sync wrapper running many bulk operations in one loop entry
+        
+        ops is a list of (kind, args) with kind one of "verify_otp",
+        "verify_password" or "save_account" and args the positional
+        arguments of the matching bulk_*_sync wrapper. Results come back
+        in order, in the same shape as the single wrappers return.
+        """
         try:
-            return self.async_manager.run_async(
-                bulk_save_account_async(client, phone_number, country, user_id, manager, accounts_col, password)
-            )
+            return self.async_manager.run_async(bulk_many_async(ops))
         except Exception as e:
-            logger.error(f"Bulk save account error: {e}")
-            return False, str(e)
+            logger.error("Bulk operations error: %s", e)
+            return [_BULK_OPS[kind][1](e) for kind, _ in ops]
     
     # -----------------------------------------------------------------
     # EXISTING SYNC WRAPPERS
     # -----------------------------------------------------------------
     
     def get_latest_otp_sync(self, session_string):
-        """Sync wrapper to get latest OTP from session - ALWAYS FETCHES NEW"""
+        """Sync wrapper to get latest OTP from session
+        
+        Fetches from Telegram unless an OTP was found for the same session
+        in the last few seconds.
+        """
+        key = ("latest", session_string)
+        otp = _otp_cache.get(key)
+        if otp is not None:
+            return otp
         try:
-            return self.async_manager.run_async(
+            otp = self.async_manager.run_async(
                 get_latest_otp_async(session_string, self.api_id, self.api_hash)
             )
         except Exception as e:
-            logger.error(f"Error getting latest OTP: {e}")
+            logger.error("Error getting latest OTP: %s", e)
             return None
+        if otp is not None:
+            _otp_cache.put(key, otp)
+        return otp
     
     def get_otp_from_database_sync(self, session_id, otp_sessions_col):
         """Sync wrapper to get OTP from database with timestamp check"""
+        key = ("db", session_id)
+        otp = _otp_cache.get(key)
+        if otp is not None:
+            return otp
         try:
-            return self.async_manager.run_async(
+            otp = self.async_manager.run_async(
                 get_otp_from_database_async(session_id, otp_sessions_col)
             )
         except Exception as e:
-            logger.error(f"Error getting OTP from database: {e}")
+            logger.error("Error getting OTP from database: %s", e)
             return None
+        if otp is not None:
+            _otp_cache.put(key, otp)
+        return otp
     
     def logout_session_sync(self, session_id, user_id, otp_sessions_col, accounts_col, orders_col):
-        """Sync wrapper to logout session"""
+        """Sync wrapper to logout session, repeated successful calls are answered from cache"""
+        key = (session_id, user_id)
+        result = _logout_cache.get(key)
+        if result is not None:
+            return result
         try:
-            return self.async_manager.run_async(
+            result = self.async_manager.run_async(
                 logout_session_async(session_id, user_id, otp_sessions_col, accounts_col, orders_col)
             )
         except Exception as e:
-            logger.error(f"Logout error: {e}")
+            logger.error("Logout error: %s", e)
             return False, str(e)
+        if result[0]:
+            _logout_cache.put(key, result)
+        return result
     
-    def start_simple_monitoring_sync(self, session_string, session_id, max_wait_time=1800):
-        """Start simple monitoring (session keep-alive only)"""
+    def start_simple_monitoring_sync(self, session_string, session_id, max_wait_time=1800, timeout=None):
+        """Start simple monitoring (session keep-alive only)
+        
+        Blocks for at most timeout seconds, max_wait_time plus a small
+        margin by default, even if the monitor itself gets stuck.
+        """
+        if timeout is None:
+            timeout = max_wait_time + 5
         try:
             return self.async_manager.run_async(
-                simple_otp_monitor(session_string, session_id, max_wait_time, self.api_id, self.api_hash)
+                asyncio.wait_for(
+                    simple_otp_monitor(session_string, session_id, max_wait_time, self.api_id, self.api_hash),
+                    timeout=timeout
+                )
             )
+        except asyncio.TimeoutError:
+            logger.warning("Monitor timeout for session %s", session_id)
+            return None
         except Exception as e:
-            logger.error(f"Simple monitoring error: {e}")
+            logger.error("Simple monitoring error: %s", e)
             return None
+    
+    # -----------------------------------------------------------------
+    # ASYNC API
+    # -----------------------------------------------------------------
+    
+    # For callers already running on the account event loop, these skip
+    # the run_async thread hop. New async code should use them directly.
+    bulk_verify_otp = staticmethod(bulk_verify_otp_async)
+    bulk_verify_password = staticmethod(bulk_verify_password_async)
+    bulk_save_account = staticmethod(bulk_save_account_async)
+    bulk_many = staticmethod(bulk_many_async)
+    get_otp_from_database = staticmethod(get_otp_from_database_async)
+    logout_session = staticmethod(logout_session_async)
+    
+    async def get_latest_otp(self, session_string):
+        """Get latest OTP from session"""
+        return await get_latest_otp_async(session_string, self.api_id, self.api_hash)
 
 # ---------------------------------------------------------------------
 # EXPORT EVERYTHING
 # ---------------------------------------------------------------------
 
-__all__ = [
+__all__ = (
     'AsyncManager',
     'PyrogramClientManager',
+    'get_manager',
     'AccountManager',
+    'acquire_client',
+    'evict_client',
     'otp_searcher',
     'get_latest_otp_async',
     'get_otp_from_database_async',
     'logout_session_async',
     'simple_otp_monitor',
+    'stop_otp_monitor',
     # Bulk functions
     'bulk_send_code_async',
+    'bulk_send_code_many_async',
+    'bulk_many_async',
     'bulk_verify_otp_async',
     'bulk_verify_password_async',
     'bulk_save_account_async'
-]
+)
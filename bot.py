@@ -1,24 +1,29 @@
 import logging
+import logging.handlers
+import queue
+import atexit
 import re
 import threading
 import time
+import collections
+import functools
+import weakref
+import concurrent.futures
 import random
 import sys
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
 import asyncio
 
-# Event loop initialization
+# Event loop initialization (pyrogram looks one up at import time; all
+# account work runs on account.py's own background loop)
 try:
     loop = asyncio.get_event_loop()
 except RuntimeError:
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
 
-# Simple fix
-import asyncio
-asyncio.set_event_loop(asyncio.new_event_loop())
 import telebot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 import telebot.types
@@ -29,9 +34,11 @@ def _disable_story(cls, obj):
     return None
 
 telebot.types.Story.de_json = _disable_story
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pyrogram import Client
 from pyrogram.errors import (
     ApiIdInvalid, PhoneNumberInvalid, PhoneCodeInvalid,
@@ -67,13 +74,157 @@ GLOBAL_API_HASH = "4e984ea35f854762dcde906dce426c2d"
 # ---------------------------------------------------------------------
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# The format above never shows thread or process info, don't collect it per record
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
+# Hand records to a background thread so handler I/O never blocks callers
+_log_queue = queue.SimpleQueue()
+_root_logger = logging.getLogger()
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, *_root_logger.handlers, respect_handler_level=True
+)
+_root_logger.handlers = [logging.handlers.QueueHandler(_log_queue)]
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 logger = logging.getLogger(__name__)
 
-bot = telebot.TeleBot(BOT_TOKEN)
+# Handlers run on telebot's worker pool, per_user below keeps each user's
+# updates from running at the same time
+bot = telebot.TeleBot(BOT_TOKEN, num_threads=16)
+
+# One long-lived keep-alive session for every Bot API call instead of a
+# per-thread session that telebot rebuilds (new TLS handshake) every 10 minutes.
+# Only connection setup is retried, a retried send could post a message twice.
+_api_session = requests.Session()
+_api_adapter = HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    max_retries=Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.2)
+)
+_api_session.mount("https://", _api_adapter)
+_api_session.mount("http://", _api_adapter)
+telebot.apihelper.session = _api_session
+telebot.apihelper.SESSION_TIME_TO_LIVE = None
+
+class TokenBucket:
+    """Allows rate calls per second on average with bursts of up to capacity"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# Telegram allows about 30 messages a second overall and one a second per chat,
+# stay a little under the global limit
+TELEGRAM_GLOBAL_RATE = 25
+TELEGRAM_CHAT_RATE = 1
+TELEGRAM_CHAT_BURST = 3
+TELEGRAM_MAX_RETRIES = 3
+
+_global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+# Per chat send buckets, least recently used first
+_chat_buckets = collections.OrderedDict()
+_chat_buckets_lock = threading.Lock()
+
+def _chat_bucket(chat_id):
+    with _chat_buckets_lock:
+        bucket = _chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = _chat_buckets[chat_id] = TokenBucket(TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST)
+            while len(_chat_buckets) > 10000:
+                _chat_buckets.popitem(last=False)
+        else:
+            _chat_buckets.move_to_end(chat_id)
+        return bucket
+
+def _rate_limited_request(method, url, params=None, files=None, timeout=None, proxies=None):
+    """Send every Bot API call through the rate limits, waiting out 429 replies"""
+    method_name = url.rsplit("/", 1)[-1]
+    if method_name != "getUpdates":
+        # Wait on the chat first so a global token isn't held while sleeping on it
+        if method_name.startswith(("send", "edit")) and params and "chat_id" in params:
+            _chat_bucket(params["chat_id"]).acquire()
+        _global_bucket.acquire()
+    
+    delay = 1.0
+    for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+        result = _api_session.request(method, url, params=params, files=files, timeout=timeout, proxies=proxies)
+        if result.status_code != 429 or attempt == TELEGRAM_MAX_RETRIES:
+            return result
+        try:
+            retry_after = result.json().get("parameters", {}).get("retry_after")
+        except ValueError:
+            retry_after = None
+        logger.warning(f"Telegram rate limited {method_name}, retrying in {retry_after or delay}s")
+        time.sleep(retry_after or delay)
+        delay = min(delay * 2, 30)
+        # Uploaded files were read by the failed attempt
+        for f in (files or {}).values():
+            if hasattr(f, "seek"):
+                f.seek(0)
+    return result
+
+telebot.apihelper.CUSTOM_REQUEST_SENDER = _rate_limited_request
+
+# Bot API calls that don't need to block the handler that issues them
+_bot_api_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="bot-api")
+
+# MongoDB work run alongside a handler, kept apart so rate limited Bot API calls can't hold it up
+_db_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="mongo")
+
+def _delete_quietly(chat_id, message_id):
+    try:
+        bot.delete_message(chat_id, message_id)
+    except:
+        pass
+
+def delete_message_background(chat_id, message_id):
+    """Delete a message without waiting for Telegram, errors are ignored"""
+    _bot_api_executor.submit(_delete_quietly, chat_id, message_id)
+
+def _send_quietly(chat_id, text, kwargs):
+    try:
+        bot.send_message(chat_id, text, **kwargs)
+    except Exception as e:
+        logger.warning(f"Could not notify {chat_id}: {e}")
+
+def send_message_background(chat_id, text, **kwargs):
+    """Send a message without waiting for Telegram, failures are only logged"""
+    _bot_api_executor.submit(_send_quietly, chat_id, text, kwargs)
 
 # MongoDB Setup
 try:
-    client = MongoClient(MONGO_URL)
+    # Keep a few warm connections so the first action after idle doesn't
+    # pay TCP + TLS + auth, and fail fast instead of hanging handlers
+    client = MongoClient(
+        MONGO_URL,
+        maxPoolSize=50,
+        minPoolSize=10,
+        maxIdleTimeMS=60000,
+        serverSelectionTimeoutMS=5000,
+        connectTimeoutMS=5000,
+        socketTimeoutMS=20000,
+        retryWrites=True,
+        compressors="zlib"
+    )
     db = client['otp_bot']
     users_col = db['users']
     accounts_col = db['accounts']
@@ -88,37 +239,111 @@ try:
     coupons_col = db['coupons']
     logger.info("✅ MongoDB connected successfully")
 except Exception as e:
-    logger.e-1003456141509DB connection failed: {e}")
+    logger.error(f"❌ MongoDB connection failed: {e}")
+
+class BoundedLRU(collections.OrderedDict):
+    """Per-user state dict that forgets its least recently set entry past max_size"""
+    
+    def __init__(self, max_size=10000):
+        super().__init__()
+        self.max_size = max_size
+        self._lock = threading.RLock()
+    
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.max_size:
+                self.popitem(last=False)
+    
+    def __delitem__(self, key):
+        with self._lock:
+            super().__delitem__(key)
+    
+    def pop(self, key, *default):
+        with self._lock:
+            return super().pop(key, *default)
+
+class TimedLRU(BoundedLRU):
+    """BoundedLRU that also drops entries not set or read for more than ttl seconds"""
+    
+    def __init__(self, ttl, max_size=10000):
+        super().__init__(max_size)
+        self.ttl = ttl
+        self._set_at = {}
+    
+    def _is_live(self, key):
+        """Refresh key if it is present and fresh, drop it if it has expired"""
+        if not super().__contains__(key):
+            return False
+        now = time.time()
+        if now - self._set_at.get(key, 0) > self.ttl:
+            super().pop(key, None)
+            self._set_at.pop(key, None)
+            return False
+        # Flows are updated in place, so a read counts as activity
+        self._set_at[key] = now
+        self.move_to_end(key)
+        return True
+    
+    def __contains__(self, key):
+        with self._lock:
+            return self._is_live(key)
+    
+    def __getitem__(self, key):
+        with self._lock:
+            if not self._is_live(key):
+                raise KeyError(key)
+            return super().__getitem__(key)
+    
+    def get(self, key, default=None):
+        with self._lock:
+            return super().__getitem__(key) if self._is_live(key) else default
+    
+    def __setitem__(self, key, value):
+        with self._lock:
+            now = time.time()
+            self._set_at[key] = now
+            super().__setitem__(key, value)
+            # Oldest entries sit at the front, stop at the first fresh one
+            for old_key in list(self):
+                if now - self._set_at.get(old_key, 0) <= self.ttl:
+                    break
+                super().pop(old_key, None)
+                self._set_at.pop(old_key, None)
+            if len(self._set_at) > 2 * len(self) + 100:
+                self._set_at = {k: self._set_at[k] for k in self if k in self._set_at}
 
 # Store temporary data
-user_states = {}
-pending_messages = {}
-active_chats = {}
-user_stage = {}
-user_last_message = {}
-user_orders = {}
-order_messages = {}
-cancellation_trackers = {}
-order_timers = {}
-change_number_requests = {}
-whatsapp_number_timers = {}
-payment_orders = {}
-admin_deduct_state = {}
-referral_data = {}
-broadcast_data = {}
-edit_price_state = {}
-coupon_state = {}
-recharge_method_state = {}
-upi_payment_states = {}
+user_states = BoundedLRU()
+pending_messages = BoundedLRU()
+active_chats = BoundedLRU()
+user_stage = BoundedLRU()
+user_last_message = BoundedLRU()
+user_orders = BoundedLRU()
+order_messages = BoundedLRU()
+cancellation_trackers = BoundedLRU()
+order_timers = BoundedLRU()
+change_number_requests = BoundedLRU()
+whatsapp_number_timers = BoundedLRU()
+payment_orders = BoundedLRU()
+admin_deduct_state = BoundedLRU()
+referral_data = BoundedLRU()
+broadcast_data = BoundedLRU()
+edit_price_state = BoundedLRU()
+coupon_state = BoundedLRU()
+recharge_method_state = BoundedLRU()
+# Payment flows that were never finished expire after 15 minutes
+upi_payment_states = TimedLRU(ttl=15 * 60)
 
 # add this line for bordcast 
 IS_BROADCASTING = False
 
 # Pyrogram login states
-login_states = {}
+login_states = BoundedLRU()
 
 # BULK ADD STATES
-bulk_add_states = {}
+bulk_add_states = BoundedLRU()
 
 # Import account management
 try:
@@ -146,34 +371,37 @@ if account_manager:
 # ---------------------------------------------------------------------
 
 def ensure_user_exists(user_id, user_name=None, username=None, referred_by=None):
-    user = users_col.find_one({"user_id": user_id})
-    if not user:
-        user_data = {
-            "user_id": user_id,
-            "name": user_name or "Unknown",
-            "username": username,
-            "referred_by": referred_by,
-            "referral_code": f"REF{user_id}",
-            "total_commission_earned": 0.0,
-            "total_referrals": 0,
-            "created_at": datetime.utcnow()
+    now = datetime.now(timezone.utc)
+    user_data = {
+        "user_id": user_id,
+        "name": user_name or "Unknown",
+        "username": username,
+        "referred_by": referred_by,
+        "referral_code": f"REF{user_id}",
+        "total_commission_earned": 0.0,
+        "total_referrals": 0,
+        "created_at": now
+    }
+    # Create the user only if missing, one round trip for new and existing users
+    result = users_col.update_one(
+        {"user_id": user_id},
+        {"$setOnInsert": user_data},
+        upsert=True
+    )
+    if result.upserted_id is not None and referred_by:
+        referral_record = {
+            "referrer_id": referred_by,
+            "referred_id": user_id,
+            "referral_code": user_data['referral_code'],
+            "status": "pending",
+            "created_at": now
         }
-        users_col.insert_one(user_data)
-        
-        if referred_by:
-            referral_record = {
-                "referrer_id": referred_by,
-                "referred_id": user_id,
-                "referral_code": user_data['referral_code'],
-                "status": "pending",
-                "created_at": datetime.utcnow()
-            }
-            referrals_col.insert_one(referral_record)
-            users_col.update_one(
-                {"user_id": referred_by},
-                {"$inc": {"total_referrals": 1}}
-            )
-            logger.info(f"Referral recorded: {referred_by} -> {user_id}")
+        referrals_col.insert_one(referral_record)
+        users_col.update_one(
+            {"user_id": referred_by},
+            {"$inc": {"total_referrals": 1}}
+        )
+        logger.info(f"Referral recorded: {referred_by} -> {user_id}")
     
     wallets_col.update_one(
         {"user_id": user_id},
@@ -182,24 +410,122 @@ def ensure_user_exists(user_id, user_name=None, username=None, referred_by=None)
     )
 
 def get_balance(user_id):
-    rec = wallets_col.find_one({"user_id": user_id})
+    rec = wallets_col.find_one({"user_id": user_id}, {"balance": 1, "_id": 0})
     return float(rec.get("balance", 0.0)) if rec else 0.0
 
+def get_user_with_balance(user_id):
+    """Get user document and wallet balance in one round trip"""
+    docs = list(users_col.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$limit": 1},
+        {"$project": {
+            "_id": 0,
+            "user_id": 1,
+            "referral_code": 1,
+            "total_commission_earned": 1,
+            "total_referrals": 1
+        }},
+        {"$lookup": {
+            "from": wallets_col.name,
+            "localField": "user_id",
+            "foreignField": "user_id",
+            "pipeline": [{"$project": {"_id": 0, "balance": 1}}],
+            "as": "wallet"
+        }}
+    ]))
+    if not docs:
+        return {}, get_balance(user_id)
+    user_data = docs[0]
+    wallet = user_data.pop("wallet", None)
+    balance = float(wallet[0].get("balance", 0.0)) if wallet else 0.0
+    return user_data, balance
+
 def add_balance(user_id, amount):
-    wallets_col.update_one(
+    """Credit the wallet and return the new balance"""
+    rec = wallets_col.find_one_and_update(
         {"user_id": user_id},
         {"$inc": {"balance": float(amount)}},
-        upsert=True
+        projection={"balance": 1, "_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return float(rec.get("balance", 0.0)) if rec else 0.0
+
+# Recharge ids remembered on each wallet so a retried approval can't credit twice
+RECHARGE_CREDIT_HISTORY = 50
+
+def credit_recharge(user_id, amount, req_id):
+    """Credit a recharge once per req_id and return the new balance"""
+    wallets_col.update_one({"user_id": user_id}, {"$setOnInsert": {"balance": 0.0}}, upsert=True)
+    rec = wallets_col.find_one_and_update(
+        {"user_id": user_id, "credited_recharges": {"$ne": req_id}},
+        {
+            "$inc": {"balance": float(amount)},
+            "$push": {"credited_recharges": {"$each": [req_id], "$slice": -RECHARGE_CREDIT_HISTORY}}
+        },
+        projection={"balance": 1, "_id": 0},
+        return_document=ReturnDocument.AFTER
     )
+    if rec is None:
+        # Credited by an earlier attempt that didn't get to mark the request approved
+        rec = wallets_col.find_one({"user_id": user_id}, {"balance": 1, "_id": 0})
+    return float(rec.get("balance", 0.0)) if rec else 0.0
 
 def deduct_balance(user_id, amount):
-    wallets_col.update_one(
+    """Debit the wallet and return the new balance"""
+    rec = wallets_col.find_one_and_update(
         {"user_id": user_id},
         {"$inc": {"balance": -float(amount)}},
-        upsert=True
+        projection={"balance": 1, "_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
     )
+    return float(rec.get("balance", 0.0)) if rec else 0.0
+
+# ---------------------------------------------------------------------
+# BUFFERED TRANSACTION LOG
+# ---------------------------------------------------------------------
+
+_tx_buffer = queue.Queue()
+TX_BATCH_SIZE = 500
+TX_FLUSH_INTERVAL = 1.0
+
+def record_transaction(transaction_record):
+    """Queue a transaction record, written to MongoDB by the flusher thread"""
+    _tx_buffer.put(transaction_record)
+
+def _flush_transactions(stop=False):
+    """Write queued transaction records in batches of up to TX_BATCH_SIZE"""
+    while True:
+        try:
+            batch = [_tx_buffer.get(timeout=TX_FLUSH_INTERVAL)]
+        except queue.Empty:
+            if stop:
+                return
+            continue
+        while len(batch) < TX_BATCH_SIZE:
+            try:
+                batch.append(_tx_buffer.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            # Unordered so one bad record doesn't drop the rest of the batch
+            transactions_col.insert_many(batch, ordered=False)
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} transaction(s): {e}")
+
+def _drain_transactions():
+    """Write whatever is still queued on shutdown"""
+    _flush_transactions(stop=True)
 
+threading.Thread(target=_flush_transactions, name="tx-flusher", daemon=True).start()
+atexit.register(_drain_transactions)
+
+# Message builders format the same prices and balances over and over
+@functools.lru_cache(maxsize=4096)
 def format_currency(x):
+    if type(x) is int:
+        return f"₹{x}"
     try:
         x = float(x)
         if x.is_integer():
@@ -211,29 +537,63 @@ def format_currency(x):
 def get_available_accounts_count(country):
     return accounts_col.count_documents({"country": country, "status": "active", "used": False})
 
+ADMIN_ID_STR = str(ADMIN_ID)
+
 def is_admin(user_id):
+    if user_id == ADMIN_ID:
+        return True
     try:
-        return str(user_id) == str(ADMIN_ID)
+        return str(user_id) == ADMIN_ID_STR
     except:
         return False
 
+# Recent ban lookups: {user_id: (expires_at, banned)}
+_ban_cache = BoundedLRU(max_size=10000)
+BAN_CACHE_TTL = 300
+
 def is_user_banned(user_id):
-    banned = banned_users_col.find_one({"user_id": user_id, "status": "active"})
-    return banned is not None
+    entry = _ban_cache.get(user_id)
+    if entry and entry[0] > time.time():
+        return entry[1]
+    banned = banned_users_col.find_one({"user_id": user_id, "status": "active"}, {"_id": 1}) is not None
+    _ban_cache[user_id] = (time.time() + BAN_CACHE_TTL, banned)
+    return banned
+
+def invalidate_ban(user_id):
+    """Forget cached ban status after a ban or unban"""
+    _ban_cache.pop(user_id, None)
 
 def get_all_countries():
     return list(countries_col.find({"status": "active"}))
 
+# Case-insensitive comparison that, unlike $regex, can use the name index
+COUNTRY_NAME_COLLATION = {"locale": "en", "strength": 2}
+
 def get_country_by_name(country_name):
-    return countries_col.find_one({
-        "name": {"$regex": f"^{country_name}$", "$options": "i"},
-        "status": "active"
-    })
+    return countries_col.find_one(
+        {"name": country_name, "status": "active"},
+        collation=COUNTRY_NAME_COLLATION
+    )
 
-def add_referral_commission(referrer_id, recharge_amount, recharge_id):
+def add_referral_commission(referrer_id, recharge_amount, recharge_id, now=None):
     try:
+        now = now or datetime.now(timezone.utc)
         commission = (recharge_amount * REFERRAL_COMMISSION) / 100
-        add_balance(referrer_id, commission)
+        
+        # The bookkeeping writes don't depend on the wallet, run them alongside it
+        bookkeeping = [
+            _db_executor.submit(
+                users_col.update_one,
+                {"user_id": referrer_id},
+                {"$inc": {"total_commission_earned": commission}}
+            ),
+            _db_executor.submit(
+                referrals_col.update_one,
+                {"referred_id": recharge_id.get("user_id"), "referrer_id": referrer_id},
+                {"$set": {"status": "completed", "commission": commission, "completed_at": now}}
+            )
+        ]
+        new_balance = add_balance(referrer_id, commission)
         
         transaction_id = f"COM{referrer_id}{int(time.time())}"
         transaction_record = {
@@ -242,20 +602,13 @@ def add_referral_commission(referrer_id, recharge_amount, recharge_id):
             "amount": commission,
             "type": "referral_commission",
             "description": f"Referral commission from recharge #{recharge_id}",
-            "timestamp": datetime.utcnow(),
+            "timestamp": now,
             "recharge_id": str(recharge_id)
         }
-        transactions_col.insert_one(transaction_record)
-        
-        users_col.update_one(
-            {"user_id": referrer_id},
-            {"$inc": {"total_commission_earned": commission}}
-        )
+        record_transaction(transaction_record)
         
-        referrals_col.update_one(
-            {"referred_id": recharge_id.get("user_id"), "referrer_id": referrer_id},
-            {"$set": {"status": "completed", "commission": commission, "completed_at": datetime.utcnow()}}
-        )
+        for future in bookkeeping:
+            future.result()
         
         try:
             bot.send_message(
@@ -264,7 +617,7 @@ def add_referral_commission(referrer_id, recharge_amount, recharge_id):
                 f"✅ You earned {format_currency(commission)} commission!\n"
                 f"📊 From: {format_currency(recharge_amount)} recharge\n"
                 f"📈 Commission Rate: {REFERRAL_COMMISSION}%\n"
-                f"💳 New Balance: {format_currency(get_balance(referrer_id))}\n\n"
+                f"💳 New Balance: {format_currency(new_balance)}\n\n"
                 f"Keep referring to earn more! 🎉"
             )
         except:
@@ -278,100 +631,168 @@ def add_referral_commission(referrer_id, recharge_amount, recharge_id):
 # UPDATED: CHECK BOTH CHANNELS MEMBERSHIP
 # ---------------------------------------------------------------------
 
+# Recent membership results, oldest first: {user_id: (expires_at, missing)}
+_membership_cache = collections.OrderedDict()
+_membership_lock = threading.Lock()
+MEMBERSHIP_CACHE_TTL = 60
+MEMBERSHIP_CACHE_MAX_SIZE = 10000
+
+# Membership checks get their own threads, background sends sleeping on rate
+# limits in the bot-api pool would time them out and turn members away
+_membership_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="membership")
+
+def _fetch_missing_channels(user_id):
+    """Ask Telegram which mandatory channels user hasn't joined, cached for a minute"""
+    now = time.time()
+    with _membership_lock:
+        entry = _membership_cache.get(user_id)
+        if entry and entry[0] > now:
+            return list(entry[1])
+    
+    # Ask about both channels at once, wall time is the slower of the two
+    channels = (MUST_JOIN_CHANNEL_1, MUST_JOIN_CHANNEL_2)
+    futures = [_membership_executor.submit(bot.get_chat_member, channel, user_id) for channel in channels]
+    
+    missing = []
+    failed = False
+    for channel, future in zip(channels, futures):
+        try:
+            member = future.result(timeout=5)
+            if member.status not in ['member', 'administrator', 'creator']:
+                missing.append(channel)
+        except Exception as e:
+            logger.error(f"Error checking channel membership: {e}")
+            missing.append(channel)
+            failed = True
+    
+    # Don't remember a result that came from an API error
+    if not failed:
+        with _membership_lock:
+            _membership_cache[user_id] = (now + MEMBERSHIP_CACHE_TTL, tuple(missing))
+            _membership_cache.move_to_end(user_id)
+            while len(_membership_cache) > MEMBERSHIP_CACHE_MAX_SIZE:
+                _membership_cache.popitem(last=False)
+    return missing
+
+def invalidate_membership(user_id):
+    """Forget cached membership so the next check asks Telegram again"""
+    with _membership_lock:
+        _membership_cache.pop(user_id, None)
+
 def has_user_joined_channels(user_id):
     """Check if user has joined both mandatory channels"""
-    try:
-        # Check first channel
-        member1 = bot.get_chat_member(MUST_JOIN_CHANNEL_1, user_id)
-        status1 = member1.status in ['member', 'administrator', 'creator']
-        
-        # Check second channel
-        member2 = bot.get_chat_member(MUST_JOIN_CHANNEL_2, user_id)
-        status2 = member2.status in ['member', 'administrator', 'creator']
-        
-        return status1 and status2
-    except Exception as e:
-        logger.error(f"Error checking channel membership: {e}")
-        return False
+    return not _fetch_missing_channels(user_id)
 
 def get_missing_channels(user_id):
     """Get list of channels user hasn't joined yet"""
-    missing = []
+    return _fetch_missing_channels(user_id)
+
+def requires_joined(handler):
+    """Callback handler decorator that turns away users missing a mandatory channel"""
+    @functools.wraps(handler)
+    def wrapper(call, user_id, data):
+        missing_channels = get_missing_channels(user_id)
+        if missing_channels:
+            missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
+            bot.answer_callback_query(
+                call.id, 
+                f"❌ Please join:\n{missing_list}", 
+                show_alert=True
+            )
+            send_join_prompt(user_id, missing_channels)
+            return
+        return handler(call, user_id, data)
+    return wrapper
+
+def admin_only(handler):
+    """Callback handler decorator that turns away everyone but the admin"""
+    @functools.wraps(handler)
+    def wrapper(call, user_id, data):
+        if not is_admin(user_id):
+            bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
+            return
+        return handler(call, user_id, data)
+    return wrapper
+
+def _answer_quietly(callback_id):
     try:
-        # Check first channel
-        try:
-            member1 = bot.get_chat_member(MUST_JOIN_CHANNEL_1, user_id)
-            if member1.status not in ['member', 'administrator', 'creator']:
-                missing.append(MUST_JOIN_CHANNEL_1)
-        except:
-            missing.append(MUST_JOIN_CHANNEL_1)
-        
-        # Check second channel
-        try:
-            member2 = bot.get_chat_member(MUST_JOIN_CHANNEL_2, user_id)
-            if member2.status not in ['member', 'administrator', 'creator']:
-                missing.append(MUST_JOIN_CHANNEL_2)
-        except:
-            missing.append(MUST_JOIN_CHANNEL_2)
-        
-        return missing
-    except Exception as e:
-        logger.error(f"Error getting missing channels: {e}")
-        return [MUST_JOIN_CHANNEL_1, MUST_JOIN_CHANNEL_2]
+        bot.answer_callback_query(callback_id)
+    except:
+        pass
+
+def acks_first(handler):
+    """Callback handler decorator that answers the query before the handler runs"""
+    # Only for handlers that never answer it themselves, a query can be
+    # answered once and the alerts elsewhere would be lost
+    @functools.wraps(handler)
+    def wrapper(call, user_id, data):
+        _bot_api_executor.submit(_answer_quietly, call.id)
+        return handler(call, user_id, data)
+    return wrapper
 
 # ---------------------------------------------------------------------
 # COUPON UTILITY FUNCTIONS
 # ---------------------------------------------------------------------
 
-def get_coupon(code):
-    return coupons_col.find_one({"coupon_code": code})
+def get_coupon(code, projection=None):
+    return coupons_col.find_one({"coupon_code": code}, projection)
 
 def is_coupon_claimed_by_user(coupon_code, user_id):
-    coupon = get_coupon(coupon_code)
-    if not coupon:
-        return False
-    claimed_users = coupon.get("claimed_users", [])
-    return user_id in claimed_users
+    # Let the server test membership instead of shipping claimed_users here
+    return coupons_col.find_one(
+        {"coupon_code": coupon_code, "claimed_users": user_id},
+        {"_id": 1}
+    ) is not None
 
 def claim_coupon(coupon_code, user_id):
     try:
-        coupon = get_coupon(coupon_code)
-        if not coupon:
-            return False, "Coupon not found"
-        
-        if user_id in coupon.get("claimed_users", []):
-            return False, "Already claimed"
-        
-        if coupon.get("status") != "active":
-            status = coupon.get("status", "inactive")
-            return False, f"Coupon {status}"
-        
-        total_claimed = coupon.get("total_claimed_count", 0)
-        max_users = coupon.get("max_users", 0)
-        if total_claimed >= max_users:
-            coupons_col.update_one(
-                {"coupon_code": coupon_code},
-                {"$set": {"status": "expired"}}
-            )
-            return False, "Fully claimed"
-        
-        result = coupons_col.update_one(
+        now = datetime.now(timezone.utc)
+        # Claim in one round trip, the filter holds every eligibility rule
+        coupon = coupons_col.find_one_and_update(
             {
                 "coupon_code": coupon_code,
                 "status": "active",
-                "total_claimed_count": {"$lt": max_users}
+                "claimed_users": {"$ne": user_id},
+                "$expr": {"$lt": [{"$ifNull": ["$total_claimed_count", 0]}, {"$ifNull": ["$max_users", 0]}]}
             },
             {
                 "$inc": {"total_claimed_count": 1},
                 "$push": {"claimed_users": user_id},
                 "$set": {
-                    "last_claimed_at": datetime.utcnow(),
+                    "last_claimed_at": now,
                     "last_claimed_by": user_id
                 }
-            }
+            },
+            projection={"amount": 1, "total_claimed_count": 1, "max_users": 1, "_id": 0},
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.modified_count == 0:
+        if not coupon:
+            # Not claimable, read it once to tell the user why. Of the claimed
+            # users only this user comes back, if present
+            coupon = get_coupon(coupon_code, {
+                "status": 1,
+                "total_claimed_count": 1,
+                "max_users": 1,
+                "claimed_users": {"$elemMatch": {"$eq": user_id}}
+            })
+            if not coupon:
+                return False, "Coupon not found"
+            
+            if user_id in coupon.get("claimed_users", []):
+                return False, "Already claimed"
+            
+            if coupon.get("status") != "active":
+                status = coupon.get("status", "inactive")
+                return False, f"Coupon {status}"
+            
+            if coupon.get("total_claimed_count", 0) >= coupon.get("max_users", 0):
+                coupons_col.update_one(
+                    {"coupon_code": coupon_code},
+                    {"$set": {"status": "expired"}}
+                )
+                return False, "Fully claimed"
+            
             return False, "Coupon no longer available"
         
         amount = coupon.get("amount", 0)
@@ -385,12 +806,11 @@ def claim_coupon(coupon_code, user_id):
             "type": "coupon_redeem",
             "description": f"Coupou redeem: {coupon_code}",
             "coupon_code": coupon_code,
-            "timestamp": datetime.utcnow()
+            "timestamp": now
         }
-        transactions_col.insert_one(transaction_record)
+        record_transaction(transaction_record)
         
-        updated_coupon = get_coupon(coupon_code)
-        if updated_coupon and updated_coupon.get("total_claimed_count", 0) >= max_users:
+        if coupon.get("total_claimed_count", 0) >= coupon.get("max_users", 0):
             coupons_col.update_one(
                 {"coupon_code": coupon_code},
                 {"$set": {"status": "expired"}}
@@ -408,7 +828,7 @@ def create_coupon(code, amount, max_users, created_by):
         if max_users < 1:
             return False, "Max users must be at least 1"
         
-        existing = get_coupon(code)
+        existing = get_coupon(code, {"_id": 1})
         if existing:
             return False, "Coupon code already exists"
         
@@ -430,7 +850,7 @@ def create_coupon(code, amount, max_users, created_by):
 
 def remove_coupon(code, removed_by):
     try:
-        coupon = get_coupon(code)
+        coupon = get_coupon(code, {"_id": 1})
         if not coupon:
             return False, "Coupon not found"
         
@@ -451,7 +871,8 @@ def remove_coupon(code, removed_by):
         return False, f"Error: {str(e)}"
 
 def get_coupon_status(code):
-    coupon = get_coupon(code)
+    # Only the first 10 claimed users are shown
+    coupon = get_coupon(code, {"claimed_users": {"$slice": 10}})
     if not coupon:
         return None
     
@@ -480,10 +901,7 @@ def edit_or_resend(chat_id, message_id, text, markup=None, parse_mode=None, phot
     try:
         if photo_url:
             # For photos, we need to send new message
-            try:
-                bot.delete_message(chat_id, message_id)
-            except:
-                pass
+            delete_message_background(chat_id, message_id)
             return bot.send_photo(chat_id, photo_url, caption=text, parse_mode=parse_mode, reply_markup=markup)
         else:
             # For text messages, try to edit first
@@ -497,73 +915,103 @@ def edit_or_resend(chat_id, message_id, text, markup=None, parse_mode=None, phot
                 )
             except Exception as e:
                 # If edit fails, delete and send new
-                try:
-                    bot.delete_message(chat_id, message_id)
-                except:
-                    pass
+                delete_message_background(chat_id, message_id)
                 return bot.send_message(chat_id, text, parse_mode=parse_mode, reply_markup=markup)
     except Exception as e:
         logger.error(f"Error in edit_or_resend: {e}")
         return bot.send_message(chat_id, text, parse_mode=parse_mode, reply_markup=markup)
 
+# Main menu caption with expandable blockquotes
+WELCOME_CAPTION = (
+    "🥂 <b>Welcome To Otp Bot By JATINYADV001</b> 🥂\n"
+    "<blockquote expandable>\n"
+    "- Automatic OTPs 📍\n"
+    "- Easy to Use 🥂🥂\n"
+    "- 24/7 Support 👨‍🔧\n"
+    "- Instant Payment Approvals 🧾\n"
+    "</blockquote>\n"
+    "<blockquote expandable>\n"
+    "🚀 <b>How to use Bot :</b>\n"
+    "1️⃣ Recharge\n"
+    "2️⃣ Select Country\n"
+    "3️⃣ Buy Account\n"
+    "4️⃣ Get Number & Login through Telegram / Telegram X / Tarbotel\n"
+    "5️⃣ Receive OTP & You're Done ✅\n"
+    "</blockquote>\n"
+    "🚀 <b>Enjoy Fast Account Buying Experience!</b>"
+)
+
+def _build_main_menu_markup(admin):
+    markup = InlineKeyboardMarkup(row_width=2)
+    # Row 1: 2 buttons
+    markup.add(
+        InlineKeyboardButton("🛒 Buy Account", callback_data="buy_account"),
+        InlineKeyboardButton("💰 Balance", callback_data="balance")
+    )
+    # Row 2: 1 button
+    markup.add(
+        InlineKeyboardButton("💳 Recharge", callback_data="recharge")
+    )
+    # Row 3: 2 buttons
+    markup.add(
+        InlineKeyboardButton("👥 Refer Friends", callback_data="refer_friends"),
+        InlineKeyboardButton("🎁 Redeem", callback_data="redeem_coupon")
+    )
+    # Row 4: 1 button
+    markup.add(
+        InlineKeyboardButton("🛠️ Support", callback_data="support")
+    )
+    # Row 5: 1 button (only for admin)
+    if admin:
+        markup.add(InlineKeyboardButton("👑 Admin Panel", callback_data="admin_panel"))
+    return markup
+
+# Built once and shared, never mutate these
+_MAIN_MENU_MARKUP_USER = _build_main_menu_markup(False)
+_MAIN_MENU_MARKUP_ADMIN = _build_main_menu_markup(True)
+
+# Single button keyboards shared by many screens, never mutate these
+_BACK_TO_MENU_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu"))
+_MAIN_MENU_BUTTON_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton("🏠 Main Menu", callback_data="back_to_menu"))
+_CLOSE_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton("❌ Close", callback_data="back_to_menu"))
+_BACK_TO_BALANCE_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton("⬅️ Back to Balance", callback_data="balance"))
+_COUPON_MENU_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton("🎟 Coupon Management", callback_data="admin_coupon_menu"))
+_ADMIN_PANEL_BUTTON_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton("🏠 Admin Panel", callback_data="admin_panel"))
+_BUY_NOW_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton("🛒 Buy Account Now", callback_data="buy_account"))
+
+# Bulk add and cancel keyboards reused across steps, never mutate these
+_BULK_PROGRESS_MARKUP = InlineKeyboardMarkup().add(
+    InlineKeyboardButton("⏸️ Pause", callback_data="pause_bulk"),
+    InlineKeyboardButton("⏭️ Skip", callback_data="skip_bulk_number"),
+    InlineKeyboardButton("❌ Cancel", callback_data="cancel_bulk")
+)
+_BULK_PAUSE_MARKUP = InlineKeyboardMarkup().add(
+    InlineKeyboardButton("⏸️ Pause", callback_data="pause_bulk"),
+    InlineKeyboardButton("❌ Cancel", callback_data="cancel_bulk")
+)
+_BULK_SKIP_MARKUP = InlineKeyboardMarkup().add(
+    InlineKeyboardButton("⏭️ Skip This Number", callback_data="skip_bulk_number"),
+    InlineKeyboardButton("❌ Cancel", callback_data="cancel_bulk")
+)
+_CANCEL_BULK_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton("❌ Cancel", callback_data="cancel_bulk"))
+_CANCEL_LOGIN_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton("❌ Cancel", callback_data="cancel_login"))
+_CANCEL_TO_MENU_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton("❌ Cancel", callback_data="back_to_menu"))
+_CANCEL_COUPON_MARKUP = InlineKeyboardMarkup().add(InlineKeyboardButton("❌ Cancel", callback_data="admin_coupon_menu"))
+
 def clean_ui_and_send_menu(chat_id, user_id, text=None, markup=None):
     """Clean UI and send main menu - FIXED: Always deletes old message"""
     try:
-        # ALWAYS try to delete the previous message
+        # ALWAYS try to delete the previous message, alongside the send below
         if user_id in user_last_message:
-            try:
-                bot.delete_message(chat_id, user_last_message[user_id])
-            except:
-                pass
-        
-        # Main menu caption with expandable blockquotes
-        caption = (
-            "🥂 <b>Welcome To Otp Bot By JATINYADV001</b> 🥂\n"
-            "<blockquote expandable>\n"
-            "- Automatic OTPs 📍\n"
-            "- Easy to Use 🥂🥂\n"
-            "- 24/7 Support 👨‍🔧\n"
-            "- Instant Payment Approvals 🧾\n"
-            "</blockquote>\n"
-            "<blockquote expandable>\n"
-            "🚀 <b>How to use Bot :</b>\n"
-            "1️⃣ Recharge\n"
-            "2️⃣ Select Country\n"
-            "3️⃣ Buy Account\n"
-            "4️⃣ Get Number & Login through Telegram / Telegram X / Tarbotel\n"
-            "5️⃣ Receive OTP & You're Done ✅\n"
-            "</blockquote>\n"
-            "🚀 <b>Enjoy Fast Account Buying Experience!</b>"
-        )
+            delete_message_background(chat_id, user_last_message[user_id])
         
         if markup is None:
-            markup = InlineKeyboardMarkup(row_width=2)
-            # Row 1: 2 buttons
-            markup.add(
-                InlineKeyboardButton("🛒 Buy Account", callback_data="buy_account"),
-                InlineKeyboardButton("💰 Balance", callback_data="balance")
-            )
-            # Row 2: 1 button
-            markup.add(
-                InlineKeyboardButton("💳 Recharge", callback_data="recharge")
-            )
-            # Row 3: 2 buttons
-            markup.add(
-                InlineKeyboardButton("👥 Refer Friends", callback_data="refer_friends"),
-                InlineKeyboardButton("🎁 Redeem", callback_data="redeem_coupon")
-            )
-            # Row 4: 1 button
-            markup.add(
-                InlineKeyboardButton("🛠️ Support", callback_data="support")
-            )
-            # Row 5: 1 button (only for admin)
-            if is_admin(user_id):
-                markup.add(InlineKeyboardButton("👑 Admin Panel", callback_data="admin_panel"))
+            markup = _MAIN_MENU_MARKUP_ADMIN if is_admin(user_id) else _MAIN_MENU_MARKUP_USER
         
         # Send new message (TEXT ONLY - NO PHOTO)
         sent_msg = bot.send_message(
             chat_id,
-            text or caption,
+            text or WELCOME_CAPTION,
             parse_mode="HTML",
             reply_markup=markup,
             disable_web_page_preview=True
@@ -574,7 +1022,7 @@ def clean_ui_and_send_menu(chat_id, user_id, text=None, markup=None):
         logger.error(f"Error in clean_ui_and_send_menu: {e}")
         # Fallback
         try:
-            sent_msg = bot.send_message(chat_id, text or caption, parse_mode="HTML", reply_markup=markup)
+            sent_msg = bot.send_message(chat_id, text or WELCOME_CAPTION, parse_mode="HTML", reply_markup=markup)
             user_last_message[user_id] = sent_msg.message_id
             return sent_msg
         except:
@@ -585,28 +1033,31 @@ def clean_ui_and_send_menu(chat_id, user_id, text=None, markup=None):
 # ---------------------------------------------------------------------
 
 def transfer_balance(sender_id, receiver_id, amount):
-    """Balance transfer function"""
+    """Balance transfer function, returns (success, message, (sender_name, sender_balance, receiver_balance))"""
     try:
         # Sender ka balance check
         sender_balance = get_balance(sender_id)
         
         if sender_balance < amount:
-            return False, "Insufficient balance"
+            return False, "Insufficient balance", None
         
         if amount <= 0:
-            return False, "Amount must be greater than 0"
+            return False, "Amount must be greater than 0", None
         
         if sender_id == receiver_id:
-            return False, "Cannot send to yourself"
+            return False, "Cannot send to yourself", None
         
-        # Check if receiver exists
-        receiver = users_col.find_one({"user_id": receiver_id})
-        if not receiver:
-            return False, "Receiver user not found"
+        # Check if receiver exists, and get sender name for the notification
+        names = {
+            doc["user_id"]: doc.get("name", "Unknown")
+            for doc in users_col.find({"user_id": {"$in": [sender_id, receiver_id]}}, {"user_id": 1, "name": 1, "_id": 0})
+        }
+        if receiver_id not in names:
+            return False, "Receiver user not found", None
         
         # Transfer balance
-        deduct_balance(sender_id, amount)
-        add_balance(receiver_id, amount)
+        sender_new_balance = deduct_balance(sender_id, amount)
+        receiver_new_balance = add_balance(receiver_id, amount)
         
         # Transaction record
         transaction_id = f"TRF{int(time.time())}{sender_id}"
@@ -618,19 +1069,89 @@ def transfer_balance(sender_id, receiver_id, amount):
             "type": "transfer",
             "timestamp": datetime.utcnow()
         }
-        transactions_col.insert_one(transaction_record)
+        record_transaction(transaction_record)
         
-        return True, f"✅ {format_currency(amount)} transferred successfully!"
+        return True, f"✅ {format_currency(amount)} transferred successfully!", (names.get(sender_id, "Unknown"), sender_new_balance, receiver_new_balance)
         
     except Exception as e:
         logger.error(f"Transfer error: {e}")
-        return False, f"Error: {str(e)}"
+        return False, f"Error: {str(e)}", None
 
 # ---------------------------------------------------------------------
 # BOT HANDLERS - UPDATED WITH TWO CHANNELS
 # ---------------------------------------------------------------------
 
+# A lock lives only while a handler holds or waits on it
+_user_locks = weakref.WeakValueDictionary()
+_user_locks_guard = threading.Lock()
+
+def per_user(handler):
+    """Run handler for one user at a time, different users run in parallel"""
+    @functools.wraps(handler)
+    def wrapper(update, *args, **kwargs):
+        user_id = update.from_user.id
+        with _user_locks_guard:
+            lock = _user_locks.get(user_id)
+            if lock is None:
+                lock = _user_locks[user_id] = threading.RLock()
+        with lock:
+            return handler(update, *args, **kwargs)
+    return wrapper
+
+JOIN_CHANNELS_CAPTION = """<b>🚀 Join Both Channels First!</b> 
+
+📢 To use this bot, you must join our official channels.
+
+👉 Get updates, new features & support from our channels.
+
+Click the buttons below to join both channels, then press VERIFY ✅"""
+
+# Deep link payload of a referral link, t.me/<bot>?start=REF<user_id>
+_REF_RE = re.compile(r'^REF(\d{1,20})$')
+
+# Phone number with country code, as typed for single and bulk account add
+_PHONE_RE = re.compile(r'^\+\d{10,15}$')
+
+# Users never disappear, so only positive lookups are remembered
+_known_referrers = BoundedLRU(max_size=4096)
+
+def referrer_exists(referrer_id):
+    """Check the referrer is a bot user, shared links skip MongoDB after the first hit"""
+    if referrer_id in _known_referrers:
+        return True
+    try:
+        if users_col.find_one({"user_id": referrer_id}, {"_id": 1}):
+            _known_referrers[referrer_id] = True
+            return True
+    except Exception as e:
+        logger.error(f"Error checking referrer {referrer_id}: {e}")
+    return False
+
+def send_join_prompt(user_id, missing_channels):
+    """Send the join buttons for the channels the user is missing"""
+    markup = InlineKeyboardMarkup(row_width=2)
+    
+    # Add buttons for both channels
+    for channel in missing_channels:
+        markup.add(InlineKeyboardButton(
+            f"📢 Join {channel}",
+            url=f"https://t.me/{channel[1:]}"
+        ))
+    
+    markup.add(InlineKeyboardButton("✅ Verify Join", callback_data="verify_join"))
+    
+    try:
+        bot.send_message(
+            user_id,
+            JOIN_CHANNELS_CAPTION,
+            parse_mode="HTML",
+            reply_markup=markup
+        )
+    except Exception as e:
+        logger.error(f"Error sending join message: {e}")
+
 @bot.message_handler(commands=['start'])
+@per_user
 def start(msg):
     user_id = msg.from_user.id
     logger.info(f"Start command from user {user_id}")
@@ -643,979 +1164,860 @@ def start(msg):
         return
     
     # Check if user has joined BOTH channels
-    if not has_user_joined_channels(user_id):
-        missing_channels = get_missing_channels(user_id)
-        
-        caption = """<b>🚀 Join Both Channels First!</b> 
-
-📢 To use this bot, you must join our official channels.
+    missing_channels = get_missing_channels(user_id)
+    if missing_channels:
+        send_join_prompt(user_id, missing_channels)
+        return
+    
+    referred_by = None
+    parts = msg.text.split()
+    match = _REF_RE.match(parts[1]) if len(parts) > 1 else None
+    if match:
+        referrer_id = int(match.group(1))
+        if referrer_exists(referrer_id):
+            referred_by = referrer_id
+            logger.info(f"Referral detected: {referrer_id} -> {user_id}")
+    
+    ensure_user_exists(user_id, msg.from_user.first_name, msg.from_user.username, referred_by)
+    clean_ui_and_send_menu(user_id, user_id)
 
-👉 Get updates, new features & support from our channels.
+# ---------------------------------------------------------------------
+# CALLBACK HANDLERS
+# ---------------------------------------------------------------------
 
-Click the buttons below to join both channels, then press VERIFY ✅"""
-        
+def _handle_verify_join(call, user_id, data):
+    # User says they just joined, don't trust the cached answer
+    invalidate_membership(user_id)
+    # Check if user has joined BOTH channels
+    missing_channels = get_missing_channels(user_id)
+    if not missing_channels:
+        try:
+            bot.delete_message(call.message.chat.id, call.message.message_id)
+        except:
+            pass
+        clean_ui_and_send_menu(call.message.chat.id, user_id)
+        bot.answer_callback_query(call.id, "✅ Verified! Welcome to the bot.", show_alert=True)
+    else:
+        caption = JOIN_CHANNELS_CAPTION
+    
         markup = InlineKeyboardMarkup(row_width=2)
-        
+    
         # Add buttons for both channels
         for channel in missing_channels:
             markup.add(InlineKeyboardButton(
                 f"📢 Join {channel}",
                 url=f"https://t.me/{channel[1:]}"
             ))
-        
+    
         markup.add(InlineKeyboardButton("✅ Verify Join", callback_data="verify_join"))
-        
+    
         try:
-            bot.send_message(
-                user_id,
+            bot.edit_message_text(
                 caption,
+                call.message.chat.id,
+                call.message.message_id,
                 parse_mode="HTML",
                 reply_markup=markup
             )
-        except Exception as e:
-            logger.error(f"Error sending join message: {e}")
-        return
-    
-    referred_by = None
-    if len(msg.text.split()) > 1:
-        referral_code = msg.text.split()[1]
-        if referral_code.startswith('REF'):
-            try:
-                referrer_id = int(referral_code[3:])
-                referrer = users_col.find_one({"user_id": referrer_id})
-                if referrer:
-                    referred_by = referrer_id
-                    logger.info(f"Referral detected: {referrer_id} -> {user_id}")
-            except:
-                pass
+        except:
+            pass
     
-    ensure_user_exists(user_id, msg.from_user.first_name, msg.from_user.username, referred_by)
-    clean_ui_and_send_menu(user_id, user_id)
+        missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
+        bot.answer_callback_query(
+            call.id, 
+            f"❌ Please join these channels first:\n{missing_list}", 
+            show_alert=True
+        )
 
-@bot.callback_query_handler(func=lambda call: True)
-def handle_callbacks(call):
-    user_id = call.from_user.id
-    data = call.data
-    
-    if is_user_banned(user_id):
-        bot.answer_callback_query(call.id, "🚫 Your account is banned", show_alert=True)
-        return
+@requires_joined
+@acks_first
+def _handle_buy_account(call, user_id, data):
+    try:
+        bot.delete_message(call.message.chat.id, call.message.message_id)
+    except:
+        pass
+    show_countries(call.message.chat.id)
+
+@requires_joined
+@acks_first
+def _handle_balance(call, user_id, data):
+    user_data, balance = get_user_with_balance(user_id)
+    commission_earned = user_data.get("total_commission_earned", 0)
+    
+    message = (
+        f"💰 **Your Balance:** {format_currency(balance)}\n\n"
+        f"📊 **Referral Stats:**\n"
+        f"• Total Commission Earned: {format_currency(commission_earned)}\n"
+        f"• Total Referrals: {user_data.get('total_referrals', 0)}\n"
+        f"• Commission Rate: {REFERRAL_COMMISSION}%\n\n"
+        f"Your Referral Code: `{user_data.get('referral_code', 'REF' + str(user_id))}`"
+    )
     
-    logger.info(f"Callback received: {data} from user {user_id}")
+    # Sirf Send Balance aur Back button
+    markup = InlineKeyboardMarkup(row_width=2)
+    markup.add(
+        InlineKeyboardButton("📤 Send Balance", callback_data="send_balance_menu")
+    )
+    markup.add(
+        InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")
+    )
     
     try:
-        if data == "verify_join":
-            # Check if user has joined BOTH channels
-            if has_user_joined_channels(user_id):
-                try:
-                    bot.delete_message(call.message.chat.id, call.message.message_id)
-                except:
-                    pass
-                clean_ui_and_send_menu(call.message.chat.id, user_id)
-                bot.answer_callback_query(call.id, "✅ Verified! Welcome to the bot.", show_alert=True)
-            else:
-                missing_channels = get_missing_channels(user_id)
-                
-                caption = """<b>🚀 Join Both Channels First!</b> 
-
-📢 To use this bot, you must join our official channels.
+        bot.delete_message(call.message.chat.id, call.message.message_id)
+    except:
+        pass
+    
+    sent_msg = bot.send_message(
+        call.message.chat.id,
+        message,
+        parse_mode="Markdown",
+        reply_markup=markup
+    )
+    user_last_message[user_id] = sent_msg.message_id
 
-👉 Get updates, new features & support from our channels.
+@requires_joined
+@acks_first
+def _handle_send_balance_menu(call, user_id, data):
+    balance = get_balance(user_id)
+    
+    message = (
+        f"📤 **Send Balance - Step 1/2**\n\n"
+        f"💰 Your Current Balance: {format_currency(balance)}\n\n"
+        f"Please enter the **Receiver's User ID**:\n"
+        f"_(Only numeric ID, e.g., 123456789)_"
+    )
+    
+    # Sirf Back button
+    markup = _BACK_TO_BALANCE_MARKUP
+    
+    edit_or_resend(
+        call.message.chat.id,
+        call.message.message_id,
+        message,
+        markup=markup,
+        parse_mode="Markdown"
+    )
+    
+    # Set user state for user ID input
+    user_stage[user_id] = "waiting_receiver_id"
 
-Click the buttons below to join both channels, then press VERIFY ✅"""
-                
-                markup = InlineKeyboardMarkup(row_width=2)
-                
-                # Add buttons for both channels
-                for channel in missing_channels:
-                    markup.add(InlineKeyboardButton(
-                        f"📢 Join {channel}",
-                        url=f"https://t.me/{channel[1:]}"
-                    ))
-                
-                markup.add(InlineKeyboardButton("✅ Verify Join", callback_data="verify_join"))
-                
-                try:
-                    bot.edit_message_text(
-                        caption,
-                        call.message.chat.id,
-                        call.message.message_id,
-                        parse_mode="HTML",
-                        reply_markup=markup
-                    )
-                except:
-                    pass
-                
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join these channels first:\n{missing_list}", 
-                    show_alert=True
-                )
-        
-        elif data == "buy_account":
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            try:
-                bot.delete_message(call.message.chat.id, call.message.message_id)
-            except:
-                pass
-            show_countries(call.message.chat.id)
-        
-        elif data == "balance":
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            balance = get_balance(user_id)
-            user_data = users_col.find_one({"user_id": user_id}) or {}
-            commission_earned = user_data.get("total_commission_earned", 0)
-            
-            message = f"💰 **Your Balance:** {format_currency(balance)}\n\n"
-            message += f"📊 **Referral Stats:**\n"
-            message += f"• Total Commission Earned: {format_currency(commission_earned)}\n"
-            message += f"• Total Referrals: {user_data.get('total_referrals', 0)}\n"
-            message += f"• Commission Rate: {REFERRAL_COMMISSION}%\n\n"
-            message += f"Your Referral Code: `{user_data.get('referral_code', 'REF' + str(user_id))}`"
-            
-            # Sirf Send Balance aur Back button
-            markup = InlineKeyboardMarkup(row_width=2)
-            markup.add(
-                InlineKeyboardButton("📤 Send Balance", callback_data="send_balance_menu")
-            )
-            markup.add(
-                InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")
-            )
-            
-            try:
-                bot.delete_message(call.message.chat.id, call.message.message_id)
-            except:
-                pass
-            
-            sent_msg = bot.send_message(
-                call.message.chat.id,
-                message,
-                parse_mode="Markdown",
-                reply_markup=markup
-            )
-            user_last_message[user_id] = sent_msg.message_id
-        
-        elif data == "send_balance_menu":
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            balance = get_balance(user_id)
-            
-            message = f"📤 **Send Balance - Step 1/2**\n\n"
-            message += f"💰 Your Current Balance: {format_currency(balance)}\n\n"
-            message += f"Please enter the **Receiver's User ID**:\n"
-            message += f"_(Only numeric ID, e.g., 123456789)_"
-            
-            # Sirf Back button
-            markup = InlineKeyboardMarkup()
-            markup.add(InlineKeyboardButton("⬅️ Back to Balance", callback_data="balance"))
-            
-            edit_or_resend(
-                call.message.chat.id,
-                call.message.message_id,
-                message,
-                markup=markup,
-                parse_mode="Markdown"
-            )
-            
-            # Set user state for user ID input
-            user_stage[user_id] = "waiting_receiver_id"
-        
-        elif data == "transfer_confirm":
-            # Transfer confirmation screen
-            transfer_data = user_states.get(user_id, {})
-            if not transfer_data or "receiver_id" not in transfer_data or "amount" not in transfer_data:
-                bot.answer_callback_query(call.id, "❌ Session expired", show_alert=True)
-                clean_ui_and_send_menu(call.message.chat.id, user_id)
-                return
-            
-            receiver_id = transfer_data["receiver_id"]
-            receiver_name = transfer_data.get("receiver_name", f"ID: {receiver_id}")
-            amount = transfer_data["amount"]
-            sender_balance = get_balance(user_id)
-            
-            message = f"📤 **Confirm Transfer**\n\n"
-            message += f"👤 Receiver: {receiver_name}\n"
-            message += f"🆔 Receiver ID: `{receiver_id}`\n"
-            message += f"💰 Amount: {format_currency(amount)}\n"
-            message += f"💳 Your Balance: {format_currency(sender_balance)}\n\n"
-            message += f"Are you sure you want to proceed?"
-            
-            markup = InlineKeyboardMarkup(row_width=2)
-            markup.add(
-                InlineKeyboardButton("✅ Confirm", callback_data="transfer_execute"),
-                InlineKeyboardButton("❌ Cancel", callback_data="balance")
-            )
-            
-            edit_or_resend(
-                call.message.chat.id,
-                call.message.message_id,
-                message,
-                markup=markup,
-                parse_mode="Markdown"
-            )
-        
-        elif data == "transfer_execute":
-            # Execute transfer
-            transfer_data = user_states.get(user_id, {})
-            if not transfer_data or "receiver_id" not in transfer_data or "amount" not in transfer_data:
-                bot.answer_callback_query(call.id, "❌ Session expired", show_alert=True)
-                clean_ui_and_send_menu(call.message.chat.id, user_id)
-                return
-            
-            receiver_id = transfer_data["receiver_id"]
-            receiver_name = transfer_data.get("receiver_name", f"ID: {receiver_id}")
-            amount = transfer_data["amount"]
-            
-            success, message_text = transfer_balance(user_id, receiver_id, amount)
-            
-            if success:
-                # Get updated balances
-                sender_new_balance = get_balance(user_id)
-                receiver_new_balance = get_balance(receiver_id)
-                
-                # Message for sender
-                sender_message = f"✅ **Transfer Successful!**\n\n"
-                sender_message += f"👤 Sent to: {receiver_name}\n"
-                sender_message += f"🆔 Receiver ID: `{receiver_id}`\n"
-                sender_message += f"💰 Amount Sent: {format_currency(amount)}\n"
-                sender_message += f"💳 Your New Balance: {format_currency(sender_new_balance)}\n\n"
-                
-                # Sirf Back to Balance button
-                markup = InlineKeyboardMarkup()
-                markup.add(InlineKeyboardButton("⬅️ Back to Balance", callback_data="balance"))
-                
-                edit_or_resend(
-                    call.message.chat.id,
-                    call.message.message_id,
-                    sender_message,
-                    markup=markup,
-                    parse_mode="Markdown"
-                )
-                
-                # Send notification to receiver
-                try:
-                    # Get sender name
-                    sender = users_col.find_one({"user_id": user_id})
-                    sender_name = sender.get("name", "Unknown") if sender else "Unknown"
-                    
-                    receiver_message = f"📥 **Balance Received!**\n\n"
-                    receiver_message += f"👤 From: {sender_name}\n"
-                    receiver_message += f"🆔 Sender ID: `{user_id}`\n"
-                    receiver_message += f"💰 Amount Received: {format_currency(amount)}\n"
-                    receiver_message += f"💳 Your New Balance: {format_currency(receiver_new_balance)}\n\n"
-                    
-                    # Sirf Close button for receiver
-                    receiver_markup = InlineKeyboardMarkup()
-                    receiver_markup.add(InlineKeyboardButton("❌ Close", callback_data="back_to_menu"))
-                    
-                    bot.send_message(
-                        receiver_id,
-                        receiver_message,
-                        parse_mode="Markdown",
-                        reply_markup=receiver_markup
-                    )
-                except Exception as e:
-                    logger.warning(f"Could not notify receiver {receiver_id}: {e}")
-                
-            else:
-                # Transfer failed
-                markup = InlineKeyboardMarkup()
-                markup.add(
-                    InlineKeyboardButton("🔄 Try Again", callback_data="send_balance_menu"),
-                    InlineKeyboardButton("⬅️ Back to Balance", callback_data="balance")
-                )
-                
-                edit_or_resend(
-                    call.message.chat.id,
-                    call.message.message_id,
-                    f"❌ **Transfer Failed!**\n\n{message_text}",
-                    markup=markup,
-                    parse_mode="Markdown"
-                )
-            
-            # Clear transfer state
-            if user_id in user_states:
-                user_states.pop(user_id, None)
-            if user_id in user_stage:
-                user_stage.pop(user_id, None)
-        
-        elif data == "redeem_coupon":
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            msg_text = "🎟 **Redeem Coupon**\n\nEnter your coupon code:"
-            markup = InlineKeyboardMarkup()
-            markup.add(InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu"))
-            
-            try:
-                bot.delete_message(call.message.chat.id, call.message.message_id)
-            except:
-                pass
-            
-            sent_msg = bot.send_message(
-                call.message.chat.id,
-                msg_text,
-                parse_mode="Markdown",
-                reply_markup=markup
-            )
-            user_last_message[user_id] = sent_msg.message_id
-            user_stage[user_id] = "waiting_coupon"
-        
-        elif data == "recharge":
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            show_recharge_methods(call.message.chat.id, call.message.message_id, user_id)
-        
-        elif data == "refer_friends":
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            try:
-                bot.delete_message(call.message.chat.id, call.message.message_id)
-            except:
-                pass
-            show_referral_info(user_id, call.message.chat.id)
-        
-        elif data == "support":
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            msg_text = "🛠️ Support: @@DADA_OTP_SUPPROT"
-            markup = InlineKeyboardMarkup()
-            markup.add(InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu"))
-            
-            try:
-                bot.delete_message(call.message.chat.id, call.message.message_id)
-            except:
-                pass
-            
-            sent_msg = bot.send_message(
-                call.message.chat.id,
-                msg_text,
-                reply_markup=markup
-            )
-            user_last_message[user_id] = sent_msg.message_id
-        
-        elif data == "admin_panel":
-            if is_admin(user_id):
-                try:
-                    bot.delete_message(call.message.chat.id, call.message.message_id)
-                except:
-                    pass
-                show_admin_panel(call.message.chat.id)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data.startswith("bulk_account_"):
-            if not is_admin(user_id):
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-                return
-            
-            country_name = data.replace("bulk_account_", "")
-            
-            bulk_add_states[user_id] = {
-                "mode": "bulk",
-                "country": country_name,
-                "phone_numbers": [],
-                "current_index": 0,
-                "total_numbers": 0,
-                "success_count": 0,
-                "failed_count": 0,
-                "failed_numbers": [],
-                "current_client": None,
-                "current_phone_code_hash": None,
-                "current_phone": None,
-                "current_manager": None,
-                "password_attempts": 0,
-                "message_id": call.message.message_id,
-                "step": "waiting_numbers",
-                "chat_id": call.message.chat.id,
-                "is_processing": False
-            }
-            
-            edit_or_resend(
-                call.message.chat.id,
-                call.message.message_id,
-                f"📦 **Bulk Account Addition**\n\n"
-                f"🌍 Country: {country_name}\n\n"
-                "📱 Enter phone numbers (one per line):\n"
-                "Format:\n"
-                "+91XXXXXXXXXX\n"
-                "+91828XXXXXXX\n"
-                "+91999XXXXXXX\n\n"
-                "⚠️ Max 50 numbers at once\n"
-                "⚠️ Include country code\n"
-                "⚠️ One number per line",
-                markup=InlineKeyboardMarkup().add(
-                    InlineKeyboardButton("❌ Cancel", callback_data="cancel_bulk")
-                )
-            )
-        
-        elif data.startswith("single_account_"):
-            country_name = data.replace("single_account_", "")
-            login_states[user_id]["country"] = country_name
-            login_states[user_id]["step"] = "phone"
-            login_states[user_id]["mode"] = "single"
-            
-            edit_or_resend(
-                call.message.chat.id,
-                call.message.message_id,
-                f"🌍 Country: {country_name}\n\n"
-                "📱 Enter phone number with country code:\n"
-                "Example: +919876543210",
-                markup=InlineKeyboardMarkup().add(
-                    InlineKeyboardButton("❌ Cancel", callback_data="cancel_login")
-                )
+def _handle_transfer_confirm(call, user_id, data):
+    # Transfer confirmation screen
+    transfer_data = user_states.get(user_id, {})
+    if not transfer_data or "receiver_id" not in transfer_data or "amount" not in transfer_data:
+        bot.answer_callback_query(call.id, "❌ Session expired", show_alert=True)
+        clean_ui_and_send_menu(call.message.chat.id, user_id)
+        return
+    
+    receiver_id = transfer_data["receiver_id"]
+    receiver_name = transfer_data.get("receiver_name", f"ID: {receiver_id}")
+    amount = transfer_data["amount"]
+    sender_balance = get_balance(user_id)
+    
+    message = (
+        f"📤 **Confirm Transfer**\n\n"
+        f"👤 Receiver: {receiver_name}\n"
+        f"🆔 Receiver ID: `{receiver_id}`\n"
+        f"💰 Amount: {format_currency(amount)}\n"
+        f"💳 Your Balance: {format_currency(sender_balance)}\n\n"
+        f"Are you sure you want to proceed?"
+    )
+    
+    markup = InlineKeyboardMarkup(row_width=2)
+    markup.add(
+        InlineKeyboardButton("✅ Confirm", callback_data="transfer_execute"),
+        InlineKeyboardButton("❌ Cancel", callback_data="balance")
+    )
+    
+    edit_or_resend(
+        call.message.chat.id,
+        call.message.message_id,
+        message,
+        markup=markup,
+        parse_mode="Markdown"
+    )
+
+def _handle_transfer_execute(call, user_id, data):
+    # Execute transfer
+    transfer_data = user_states.get(user_id, {})
+    if not transfer_data or "receiver_id" not in transfer_data or "amount" not in transfer_data:
+        bot.answer_callback_query(call.id, "❌ Session expired", show_alert=True)
+        clean_ui_and_send_menu(call.message.chat.id, user_id)
+        return
+    
+    receiver_id = transfer_data["receiver_id"]
+    receiver_name = transfer_data.get("receiver_name", f"ID: {receiver_id}")
+    amount = transfer_data["amount"]
+    
+    success, message_text, details = transfer_balance(user_id, receiver_id, amount)
+    
+    if success:
+        sender_name, sender_new_balance, receiver_new_balance = details
+    
+        # Message for sender
+        sender_message = (
+            f"✅ **Transfer Successful!**\n\n"
+            f"👤 Sent to: {receiver_name}\n"
+            f"🆔 Receiver ID: `{receiver_id}`\n"
+            f"💰 Amount Sent: {format_currency(amount)}\n"
+            f"💳 Your New Balance: {format_currency(sender_new_balance)}\n\n"
+        )
+    
+        # Sirf Back to Balance button
+        markup = _BACK_TO_BALANCE_MARKUP
+    
+        edit_or_resend(
+            call.message.chat.id,
+            call.message.message_id,
+            sender_message,
+            markup=markup,
+            parse_mode="Markdown"
+        )
+    
+        # Send notification to receiver
+        receiver_message = (
+            f"📥 **Balance Received!**\n\n"
+            f"👤 From: {sender_name}\n"
+            f"🆔 Sender ID: `{user_id}`\n"
+            f"💰 Amount Received: {format_currency(amount)}\n"
+            f"💳 Your New Balance: {format_currency(receiver_new_balance)}\n\n"
+        )
+    
+        # Sirf Close button for receiver
+        receiver_markup = _CLOSE_MARKUP
+    
+        send_message_background(
+            receiver_id,
+            receiver_message,
+            parse_mode="Markdown",
+            reply_markup=receiver_markup
+        )
+    
+    else:
+        # Transfer failed
+        markup = InlineKeyboardMarkup()
+        markup.add(
+            InlineKeyboardButton("🔄 Try Again", callback_data="send_balance_menu"),
+            InlineKeyboardButton("⬅️ Back to Balance", callback_data="balance")
+        )
+    
+        edit_or_resend(
+            call.message.chat.id,
+            call.message.message_id,
+            f"❌ **Transfer Failed!**\n\n{message_text}",
+            markup=markup,
+            parse_mode="Markdown"
+        )
+    
+    # Clear transfer state
+    user_states.pop(user_id, None)
+    user_stage.pop(user_id, None)
+
+@requires_joined
+@acks_first
+def _handle_redeem_coupon(call, user_id, data):
+    msg_text = "🎟 **Redeem Coupon**\n\nEnter your coupon code:"
+    markup = _BACK_TO_MENU_MARKUP
+    
+    try:
+        bot.delete_message(call.message.chat.id, call.message.message_id)
+    except:
+        pass
+    
+    sent_msg = bot.send_message(
+        call.message.chat.id,
+        msg_text,
+        parse_mode="Markdown",
+        reply_markup=markup
+    )
+    user_last_message[user_id] = sent_msg.message_id
+    user_stage[user_id] = "waiting_coupon"
+
+@requires_joined
+@acks_first
+def _handle_recharge(call, user_id, data):
+    show_recharge_methods(call.message.chat.id, call.message.message_id, user_id)
+
+@requires_joined
+@acks_first
+def _handle_refer_friends(call, user_id, data):
+    try:
+        bot.delete_message(call.message.chat.id, call.message.message_id)
+    except:
+        pass
+    show_referral_info(user_id, call.message.chat.id)
+
+@requires_joined
+@acks_first
+def _handle_support(call, user_id, data):
+    msg_text = "🛠️ Support: @@DADA_OTP_SUPPROT"
+    markup = _BACK_TO_MENU_MARKUP
+    
+    try:
+        bot.delete_message(call.message.chat.id, call.message.message_id)
+    except:
+        pass
+    
+    sent_msg = bot.send_message(
+        call.message.chat.id,
+        msg_text,
+        reply_markup=markup
+    )
+    user_last_message[user_id] = sent_msg.message_id
+
+@admin_only
+def _handle_admin_panel(call, user_id, data):
+    try:
+        bot.delete_message(call.message.chat.id, call.message.message_id)
+    except:
+        pass
+    show_admin_panel(call.message.chat.id)
+
+@admin_only
+def _handle_bulk_account(call, user_id, data):
+    country_name = data.removeprefix("bulk_account_")
+    
+    previous = bulk_add_states.get(user_id)
+    if previous:
+        drop_prefetched_codes(previous)
+    
+    bulk_add_states[user_id] = {
+        "mode": "bulk",
+        "country": country_name,
+        "phone_numbers": [],
+        "current_index": 0,
+        "total_numbers": 0,
+        "success_count": 0,
+        "failed_count": 0,
+        "failed_numbers": [],
+        "current_client": None,
+        "current_phone_code_hash": None,
+        "current_phone": None,
+        "current_manager": None,
+        "password_attempts": 0,
+        "message_id": call.message.message_id,
+        "step": "waiting_numbers",
+        "chat_id": call.message.chat.id,
+        "last_edit_ts": 0.0,
+        "is_processing": False
+    }
+    
+    edit_or_resend(
+        call.message.chat.id,
+        call.message.message_id,
+        f"📦 **Bulk Account Addition**\n\n"
+        f"🌍 Country: {country_name}\n\n"
+        "📱 Enter phone numbers (one per line):\n"
+        "Format:\n"
+        "+91XXXXXXXXXX\n"
+        "+91828XXXXXXX\n"
+        "+91999XXXXXXX\n\n"
+        "⚠️ Max 50 numbers at once\n"
+        "⚠️ Include country code\n"
+        "⚠️ One number per line",
+        markup=_CANCEL_BULK_MARKUP
+    )
+
+@acks_first
+def _handle_single_account(call, user_id, data):
+    country_name = data.removeprefix("single_account_")
+    login_states[user_id]["country"] = country_name
+    login_states[user_id]["step"] = "phone"
+    login_states[user_id]["mode"] = "single"
+    
+    edit_or_resend(
+        call.message.chat.id,
+        call.message.message_id,
+        f"🌍 Country: {country_name}\n\n"
+        "📱 Enter phone number with country code:\n"
+        "Example: +919876543210",
+        markup=_CANCEL_LOGIN_MARKUP
+    )
+
+@admin_only
+def _handle_start_bulk_add(call, user_id, data):
+    if user_id not in bulk_add_states:
+        bot.answer_callback_query(call.id, "❌ Session expired", show_alert=True)
+        return
+    
+    state = bulk_add_states[user_id]
+    if not state.get("phone_numbers"):
+        bot.answer_callback_query(call.id, "❌ No phone numbers to process", show_alert=True)
+        return
+    
+    bot.answer_callback_query(call.id, "🚀 Starting bulk account addition...")
+    start_bulk_processing(user_id)
+
+@acks_first
+def _handle_cancel_bulk(call, user_id, data):
+    handle_cancel_bulk(call)
+
+def _handle_pause_bulk(call, user_id, data):
+    if user_id in bulk_add_states:
+        bulk_add_states[user_id]["is_processing"] = False
+        bot.answer_callback_query(call.id, "⏸️ Processing paused", show_alert=True)
+
+def _handle_resume_bulk(call, user_id, data):
+    if user_id in bulk_add_states:
+        bulk_add_states[user_id]["is_processing"] = True
+        bot.answer_callback_query(call.id, "▶️ Processing resumed", show_alert=True)
+        process_next_bulk_number(user_id)
+
+def _handle_skip_bulk_number(call, user_id, data):
+    if user_id in bulk_add_states:
+        state = bulk_add_states[user_id]
+        state["failed_count"] += 1
+        state["failed_numbers"].append({
+            "number": state.get("current_phone", "Unknown"),
+            "reason": "Skipped by admin"
+        })
+    
+        if state.get("current_client") and account_manager:
+            # The client lives on the account loop, disconnect it there
+            account_manager.disconnect_client_background(state["current_client"])
+    
+        state["current_index"] += 1
+        state["password_attempts"] = 0
+        bot.answer_callback_query(call.id, "⏭️ Number skipped", show_alert=True)
+        process_next_bulk_number(user_id)
+
+@requires_joined
+def _handle_country_raw(call, user_id, data):
+    country_name = data.removeprefix("country_raw_")
+    show_country_details(user_id, country_name, call.message.chat.id, call.message.message_id, call.id)
+
+@requires_joined
+def _handle_buy(call, user_id, data):
+    account_id = data.split("_", 1)[1]
+    process_purchase(user_id, account_id, call.message.chat.id, call.message.message_id, call.id)
+
+def _handle_logout_session(call, user_id, data):
+    session_id = data.split("_", 2)[2]
+    handle_logout_session(user_id, session_id, call.message.chat.id, call.id)
+
+@requires_joined
+def _handle_get_otp(call, user_id, data):
+    session_id = data.split("_", 2)[2]
+    get_latest_otp(user_id, session_id, call.message.chat.id, call.id)
+
+@requires_joined
+@acks_first
+def _handle_back_to_countries(call, user_id, data):
+    try:
+        bot.delete_message(call.message.chat.id, call.message.message_id)
+    except:
+        pass
+    show_countries(call.message.chat.id)
+
+@acks_first
+def _handle_back_to_menu(call, user_id, data):
+    clean_ui_and_send_menu(call.message.chat.id, user_id)
+
+@requires_joined
+@acks_first
+def _handle_recharge_upi(call, user_id, data):
+    recharge_method_state[user_id] = "upi"
+    edit_or_resend(
+        call.message.chat.id,
+        call.message.message_id,
+        "💳 Enter recharge amount for UPI (minimum ₹1):",
+        markup=_CANCEL_TO_MENU_MARKUP
+    )
+    bot.register_next_step_handler(call.message, process_recharge_amount)
+
+@requires_joined
+@acks_first
+def _handle_recharge_crypto(call, user_id, data):
+    recharge_method_state[user_id] = "crypto"
+    edit_or_resend(
+        call.message.chat.id,
+        call.message.message_id,
+        "💳 Enter recharge amount in INR for Crypto (minimum ₹1):",
+        markup=_CANCEL_TO_MENU_MARKUP
+    )
+    bot.register_next_step_handler(call.message, process_recharge_amount)
+
+def _handle_upi_deposited(call, user_id, data):
+    amount = upi_payment_states.get(user_id, {}).get("amount", 0)
+    if amount <= 0:
+        bot.answer_callback_query(call.id, "❌ Invalid amount", show_alert=True)
+        return
+    
+    bot.answer_callback_query(call.id, "📝 Please send your 12-digit UTR number", show_alert=False)
+    
+    upi_payment_states[user_id] = {
+        "step": "waiting_utr",
+        "amount": amount,
+        "chat_id": call.message.chat.id
+    }
+    
+    bot.send_message(
+        call.message.chat.id,
+        "📝 **Step 1: Enter UTR**\n\n"
+        "Please send your 12-digit UTR number:\n"
+        "_(Sent by your bank after payment)_"
+    )
+
+# Seconds before an unfinished approval claim may be taken over
+RECHARGE_CLAIM_TIMEOUT = 300
+
+@admin_only
+def _handle_recharge_decision(call, user_id, data):
+    parts = data.split("|")
+    action = parts[0]
+    req_id = parts[1] if len(parts) > 1 else None
+    # Approvals are claimed as processing until the wallet is credited
+    new_status = "processing" if action == "approve_rech" else "cancelled"
+    now = datetime.now(timezone.utc)
+    claim_filter = {"req_id": req_id, "status": "pending"}
+    if action == "approve_rech":
+        # A claim left behind by a crash can be approved again, the credit is idempotent
+        claim_filter = {"req_id": req_id, "$or": [
+            {"status": "pending"},
+            {"status": "processing", "processed_at": {"$lt": now - timedelta(seconds=RECHARGE_CLAIM_TIMEOUT)}}
+        ]}
+    # Decide and claim the request in one step, a second tap can't process it again
+    req = recharges_col.find_one_and_update(
+        claim_filter,
+        {"$set": {"status": new_status, "processed_at": now, "processed_by": ADMIN_ID}},
+        projection={"user_id": 1, "amount": 1, "utr": 1},
+        return_document=ReturnDocument.AFTER
+    ) if req_id else None
+    
+    if not req:
+        existing = recharges_col.find_one({"req_id": req_id}, {"status": 1}) if req_id else None
+        if existing:
+            bot.answer_callback_query(call.id, f"⚠️ Request already {existing.get('status')}", show_alert=True)
+        else:
+            bot.answer_callback_query(call.id, "❌ Request not found", show_alert=True)
+        return
+    
+    user_target = req.get("user_id")
+    amount = float(req.get("amount", 0))
+    
+    if action == "approve_rech":
+        # Look up the referrer while the wallet is credited
+        referrer_lookup = _db_executor.submit(users_col.find_one, {"user_id": user_target}, {"referred_by": 1})
+        try:
+            new_balance = credit_recharge(user_target, amount, req_id)
+        except Exception:
+            # Nothing was credited, hand the request back so it can be retried
+            recharges_col.update_one(
+                {"req_id": req_id, "status": "processing"},
+                {"$set": {"status": "pending"}, "$unset": {"processed_at": "", "processed_by": ""}}
             )
-        
-        elif data == "start_bulk_add":
-            if not is_admin(user_id):
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-                return
-            
-            if user_id not in bulk_add_states:
-                bot.answer_callback_query(call.id, "❌ Session expired", show_alert=True)
-                return
-            
-            state = bulk_add_states[user_id]
-            if not state.get("phone_numbers"):
-                bot.answer_callback_query(call.id, "❌ No phone numbers to process", show_alert=True)
-                return
-            
-            bot.answer_callback_query(call.id, "🚀 Starting bulk account addition...")
-            start_bulk_processing(user_id)
-        
-        elif data == "cancel_bulk":
-            handle_cancel_bulk(call)
-        
-        elif data == "pause_bulk":
-            if user_id in bulk_add_states:
-                bulk_add_states[user_id]["is_processing"] = False
-                bot.answer_callback_query(call.id, "⏸️ Processing paused", show_alert=True)
-        
-        elif data == "resume_bulk":
-            if user_id in bulk_add_states:
-                bulk_add_states[user_id]["is_processing"] = True
-                bot.answer_callback_query(call.id, "▶️ Processing resumed", show_alert=True)
-                process_next_bulk_number(user_id)
-        
-        elif data == "skip_bulk_number":
-            if user_id in bulk_add_states:
-                state = bulk_add_states[user_id]
-                state["failed_count"] += 1
-                state["failed_numbers"].append({
-                    "number": state.get("current_phone", "Unknown"),
-                    "reason": "Skipped by admin"
-                })
-                
-                if state.get("current_client") and account_manager:
-                    try:
-                        asyncio.run(account_manager.pyrogram_manager.safe_disconnect(state["current_client"]))
-                    except:
-                        pass
-                
-                state["current_index"] += 1
-                state["password_attempts"] = 0
-                bot.answer_callback_query(call.id, "⏭️ Number skipped", show_alert=True)
-                process_next_bulk_number(user_id)
-        
-        elif data.startswith("country_raw_"):
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            country_name = data.replace("country_raw_", "")
-            show_country_details(user_id, country_name, call.message.chat.id, call.message.message_id, call.id)
-        
-        elif data.startswith("buy_"):
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            account_id = data.split("_", 1)[1]
-            process_purchase(user_id, account_id, call.message.chat.id, call.message.message_id, call.id)
-        
-        elif data.startswith("logout_session_"):
-            session_id = data.split("_", 2)[2]
-            handle_logout_session(user_id, session_id, call.message.chat.id, call.id)
-        
-        elif data.startswith("get_otp_"):
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            session_id = data.split("_", 2)[2]
-            get_latest_otp(user_id, session_id, call.message.chat.id, call.id)
-        
-        elif data == "back_to_countries":
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            try:
-                bot.delete_message(call.message.chat.id, call.message.message_id)
-            except:
-                pass
-            show_countries(call.message.chat.id)
-        
-        elif data == "back_to_menu":
-            clean_ui_and_send_menu(call.message.chat.id, user_id)
-        
-        elif data == "recharge_upi":
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            recharge_method_state[user_id] = "upi"
-            edit_or_resend(
-                call.message.chat.id,
-                call.message.message_id,
-                "💳 Enter recharge amount for UPI (minimum ₹1):",
-                markup=InlineKeyboardMarkup().add(
-                    InlineKeyboardButton("❌ Cancel", callback_data="back_to_menu")
-                )
+            raise
+        recharges_col.update_one({"req_id": req_id}, {"$set": {"status": "approved"}})
+        bot.answer_callback_query(call.id, "✅ Recharge approved", show_alert=True)
+    
+        try:
+            log_recharge_approved_async(
+                user_id=user_target,
+                amount=amount,
+                method="UPI",
+                utr=req.get("utr")
             )
-            bot.register_next_step_handler(call.message, process_recharge_amount)
-        
-        elif data == "recharge_crypto":
-            if not has_user_joined_channels(user_id):
-                missing_channels = get_missing_channels(user_id)
-                missing_list = "\n".join([f"• {ch}" for ch in missing_channels])
-                bot.answer_callback_query(
-                    call.id, 
-                    f"❌ Please join:\n{missing_list}", 
-                    show_alert=True
-                )
-                start(call.message)
-                return
-            
-            recharge_method_state[user_id] = "crypto"
+        except:
+            pass
+    
+        user_data = referrer_lookup.result()
+        if user_data and user_data.get("referred_by"):
+            add_referral_commission(user_data["referred_by"], amount, req, now)
+    
+        kb = _BUY_NOW_MARKUP
+    
+        try:
+            bot.delete_message(call.message.chat.id, call.message.message_id)
+        except:
+            pass
+    
+        send_message_background(
+            user_target,
+            f"✅ Your recharge of {format_currency(amount)} has been approved and added to your wallet.\n\n"
+            f"💰 <b>New Balance: {format_currency(new_balance)}</b>\n\n"
+            f"Click below to buy accounts:",
+            parse_mode="HTML",
+            reply_markup=kb
+        )
+    else:
+        bot.answer_callback_query(call.id, "❌ Recharge cancelled", show_alert=True)
+    
+        try:
+            bot.delete_message(call.message.chat.id, call.message.message_id)
+        except:
+            pass
+    
+        send_message_background(user_target, f"❌ Your recharge of {format_currency(amount)} was not received.")
+
+def _handle_add_account(call, user_id, data):
+    logger.info(f"Add account button clicked by user {user_id}")
+    if not is_admin(user_id):
+        bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
+        return
+    
+    login_states[user_id] = {
+        "step": "select_country",
+        "message_id": call.message.message_id,
+        "chat_id": call.message.chat.id
+    }
+    
+    countries = get_all_countries()
+    if not countries:
+        bot.answer_callback_query(call.id, "❌ No countries available. Add a country first.", show_alert=True)
+        return
+    
+    markup = InlineKeyboardMarkup(row_width=2)
+    for country in countries:
+        markup.add(InlineKeyboardButton(
+            country['name'],
+            callback_data=f"login_country_{country['name']}"
+        ))
+    markup.add(InlineKeyboardButton("❌ Cancel", callback_data="cancel_login"))
+    
+    edit_or_resend(
+        call.message.chat.id,
+        call.message.message_id,
+        "🌍 **Select Country for Account**\n\nChoose country:",
+        markup=markup
+    )
+
+def _handle_login_country(call, user_id, data):
+    handle_login_country_selection(call)
+
+@acks_first
+def _handle_cancel_login(call, user_id, data):
+    handle_cancel_login(call)
+
+def _handle_out_of_stock(call, user_id, data):
+    bot.answer_callback_query(call.id, "❌ Out of Stock! No accounts available.", show_alert=True)
+
+@admin_only
+def _handle_edit_price(call, user_id, data):
+    bot.answer_callback_query(call.id, "Processing...")
+    show_edit_price_country_selection(call.message.chat.id, call.message.message_id)
+
+@admin_only
+def _handle_edit_price_country(call, user_id, data):
+    country_name = data.removeprefix("edit_price_country_")
+    show_edit_price_details(call.message.chat.id, call.message.message_id, country_name)
+
+@admin_only
+def _handle_edit_price_confirm(call, user_id, data):
+    country_name = data.removeprefix("edit_price_confirm_")
+    edit_price_state[user_id] = {"country": country_name, "step": "waiting_price"}
+    try:
+        country = get_country_by_name(country_name)
+        if country:
+            current_price = country.get("price", 0)
             edit_or_resend(
                 call.message.chat.id,
                 call.message.message_id,
-                "💳 Enter recharge amount in INR for Crypto (minimum ₹1):",
+                f"🌍 Country: {country_name}\n💰 Current Price: {format_currency(current_price)}\n\n"
+                f"Enter new price for {country_name}:",
                 markup=InlineKeyboardMarkup().add(
-                    InlineKeyboardButton("❌ Cancel", callback_data="back_to_menu")
+                    InlineKeyboardButton("❌ Cancel", callback_data="manage_countries")
                 )
             )
-            bot.register_next_step_handler(call.message, process_recharge_amount)
-        
-        elif data == "upi_deposited":
-            user_id = call.from_user.id
-            amount = upi_payment_states.get(user_id, {}).get("amount", 0)
-            if amount <= 0:
-                bot.answer_callback_query(call.id, "❌ Invalid amount", show_alert=True)
-                return
-            
-            bot.answer_callback_query(call.id, "📝 Please send your 12-digit UTR number", show_alert=False)
-            
-            upi_payment_states[user_id] = {
-                "step": "waiting_utr",
-                "amount": amount,
-                "chat_id": call.message.chat.id
-            }
-            
-            bot.send_message(
-                call.message.chat.id,
-                "📝 **Step 1: Enter UTR**\n\n"
-                "Please send your 12-digit UTR number:\n"
-                "_(Sent by your bank after payment)_"
-            )
-        
-        elif data.startswith("approve_rech|") or data.startswith("cancel_rech|"):
-            if is_admin(user_id):
-                parts = data.split("|")
-                action = parts[0]
-                req_id = parts[1] if len(parts) > 1 else None
-                req = recharges_col.find_one({"req_id": req_id}) if req_id else None
-                
-                if not req:
-                    bot.answer_callback_query(call.id, "❌ Request not found", show_alert=True)
-                    return
-                
-                user_target = req.get("user_id")
-                amount = float(req.get("amount", 0))
-                
-                if action == "approve_rech":
-                    add_balance(user_target, amount)
-                    recharges_col.update_one(
-                        {"req_id": req_id},
-                        {"$set": {"status": "approved", "processed_at": datetime.utcnow(), "processed_by": ADMIN_ID}}
-                    )
-                    bot.answer_callback_query(call.id, "✅ Recharge approved", show_alert=True)
-                    
-                    try:
-                        from logs import log_recharge_approved_async
-                        log_recharge_approved_async(
-                            user_id=user_target,
-                            amount=amount,
-                            method="UPI",
-                            utr=req.get("utr")
-                        )
-                    except:
-                        pass
-                    
-                    user_data = users_col.find_one({"user_id": user_target})
-                    if user_data and user_data.get("referred_by"):
-                        add_referral_commission(user_data["referred_by"], amount, req)
-                    
-                    kb = InlineKeyboardMarkup()
-                    kb.add(InlineKeyboardButton("🛒 Buy Account Now", callback_data="buy_account"))
-                    
-                    try:
-                        bot.delete_message(call.message.chat.id, call.message.message_id)
-                    except:
-                        pass
-                    
-                    bot.send_message(
-                        user_target,
-                        f"✅ Your recharge of {format_currency(amount)} has been approved and added to your wallet.\n\n"
-                        f"💰 <b>New Balance: {format_currency(get_balance(user_target))}</b>\n\n"
-                        f"Click below to buy accounts:",
-                        parse_mode="HTML",
-                        reply_markup=kb
-                    )
-                else:
-                    recharges_col.update_one(
-                        {"req_id": req_id},
-                        {"$set": {"status": "cancelled", "processed_at": datetime.utcnow(), "processed_by": ADMIN_ID}}
-                    )
-                    bot.answer_callback_query(call.id, "❌ Recharge cancelled", show_alert=True)
-                    
-                    try:
-                        bot.delete_message(call.message.chat.id, call.message.message_id)
-                    except:
-                        pass
-                    
-                    bot.send_message(user_target, f"❌ Your recharge of {format_currency(amount)} was not received.")
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "add_account":
-            logger.info(f"Add account button clicked by user {user_id}")
-            if not is_admin(user_id):
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-                return
-            
-            login_states[user_id] = {
-                "step": "select_country",
-                "message_id": call.message.message_id,
-                "chat_id": call.message.chat.id
-            }
-            
-            countries = get_all_countries()
-            if not countries:
-                bot.answer_callback_query(call.id, "❌ No countries available. Add a country first.", show_alert=True)
-                return
-            
-            markup = InlineKeyboardMarkup(row_width=2)
-            for country in countries:
-                markup.add(InlineKeyboardButton(
-                    country['name'],
-                    callback_data=f"login_country_{country['name']}"
-                ))
-            markup.add(InlineKeyboardButton("❌ Cancel", callback_data="cancel_login"))
-            
-            edit_or_resend(
-                call.message.chat.id,
-                call.message.message_id,
-                "🌍 **Select Country for Account**\n\nChoose country:",
-                markup=markup
-            )
-        
-        elif data.startswith("login_country_"):
-            handle_login_country_selection(call)
-        
-        elif data == "cancel_login":
-            handle_cancel_login(call)
-        
-        elif data == "out_of_stock":
-            bot.answer_callback_query(call.id, "❌ Out of Stock! No accounts available.", show_alert=True)
-        
-        elif data == "edit_price":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "Processing...")
-                show_edit_price_country_selection(call.message.chat.id, call.message.message_id)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data.startswith("edit_price_country_"):
-            if is_admin(user_id):
-                country_name = data.replace("edit_price_country_", "")
-                show_edit_price_details(call.message.chat.id, call.message.message_id, country_name)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data.startswith("edit_price_confirm_"):
-            if is_admin(user_id):
-                country_name = data.replace("edit_price_confirm_", "")
-                edit_price_state[user_id] = {"country": country_name, "step": "waiting_price"}
-                try:
-                    country = get_country_by_name(country_name)
-                    if country:
-                        current_price = country.get("price", 0)
-                        edit_or_resend(
-                            call.message.chat.id,
-                            call.message.message_id,
-                            f"🌍 Country: {country_name}\n💰 Current Price: {format_currency(current_price)}\n\n"
-                            f"Enter new price for {country_name}:",
-                            markup=InlineKeyboardMarkup().add(
-                                InlineKeyboardButton("❌ Cancel", callback_data="manage_countries")
-                            )
-                        )
-                    else:
-                        bot.answer_callback_query(call.id, "❌ Country not found", show_alert=True)
-                except:
-                    pass
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "cancel_edit_price":
-            if is_admin(user_id):
-                show_country_management(call.message.chat.id)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "admin_coupon_menu":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "🎟 Coupon Management")
-                show_coupon_management(call.message.chat.id, call.message.message_id)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "admin_create_coupon":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "Creating coupon...")
-                coupon_state[user_id] = {"step": "ask_code"}
-                edit_or_resend(
-                    call.message.chat.id,
-                    call.message.message_id,
-                    "🎟 **Create Coupon**\n\nEnter coupon code:",
-                    markup=InlineKeyboardMarkup().add(
-                        InlineKeyboardButton("❌ Cancel", callback_data="admin_coupon_menu")
-                    ),
-                    parse_mode="Markdown"
-                )
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "admin_remove_coupon":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "Removing coupon...")
-                coupon_state[user_id] = {"step": "ask_remove_code"}
-                edit_or_resend(
-                    call.message.chat.id,
-                    call.message.message_id,
-                    "🗑 **Remove Coupon**\n\nEnter coupon code to remove:",
-                    markup=InlineKeyboardMarkup().add(
-                        InlineKeyboardButton("❌ Cancel", callback_data="admin_coupon_menu")
-                    ),
-                    parse_mode="Markdown"
-                )
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "admin_coupon_status":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "Checking coupon status...")
-                coupon_state[user_id] = {"step": "ask_status_code"}
-                edit_or_resend(
-                    call.message.chat.id,
-                    call.message.message_id,
-                    "📊 **Coupon Status**\n\nEnter coupon code to check:",
-                    markup=InlineKeyboardMarkup().add(
-                        InlineKeyboardButton("❌ Cancel", callback_data="admin_coupon_menu")
-                    ),
-                    parse_mode="Markdown"
-                )
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "broadcast_menu":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "📢 Reply any photo / document / video / text with /sendbroadcast")
-                bot.send_message(call.message.chat.id, "📢 **Broadcast Instructions**\n\nReply to any message (photo / document / video / text) with /sendbroadcast\n\n✅ The message will be forwarded as-is to all users.")
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "refund_start":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "Processing...")
-                msg = bot.send_message(call.message.chat.id, "💸 Enter user ID for refund:")
-                bot.register_next_step_handler(msg, ask_refund_user)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "ranking":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "📊 Generating ranking...")
-                show_user_ranking(call.message.chat.id)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "message_user":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "👤 Enter user ID to send message:")
-                msg = bot.send_message(call.message.chat.id, "👤 Enter user ID to send message:")
-                bot.register_next_step_handler(msg, ask_message_content)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "admin_deduct_start":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "Processing...")
-                admin_deduct_state[user_id] = {"step": "ask_user_id"}
-                msg = bot.send_message(call.message.chat.id, "👤 Enter User ID whose balance you want to deduct:")
-                if user_id in broadcast_data:
-                    del broadcast_data[user_id]
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "ban_user":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "Processing...")
-                msg = bot.send_message(call.message.chat.id, "🚫 Enter User ID to ban:")
-                bot.register_next_step_handler(msg, ask_ban_user)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "unban_user":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "Processing...")
-                msg = bot.send_message(call.message.chat.id, "✅ Enter User ID to unban:")
-                bot.register_next_step_handler(msg, ask_unban_user)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "manage_countries":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "Processing...")
-                show_country_management(call.message.chat.id)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "add_country":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "Processing...")
-                msg = bot.send_message(call.message.chat.id, "🌍 Enter country name to add:")
-                bot.register_next_step_handler(msg, ask_country_name)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data == "remove_country":
-            if is_admin(user_id):
-                bot.answer_callback_query(call.id, "Processing...")
-                show_country_removal(call.message.chat.id)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
-        elif data.startswith("remove_country_"):
-            if is_admin(user_id):
-                country_name = data.split("_", 2)[2]
-                result = remove_country(country_name, call.message.chat.id, call.message.message_id)
-                bot.answer_callback_query(call.id, result, show_alert=True)
-            else:
-                bot.answer_callback_query(call.id, "❌ Unauthorized", show_alert=True)
-        
         else:
+            bot.answer_callback_query(call.id, "❌ Country not found", show_alert=True)
+    except:
+        pass
+
+@admin_only
+def _handle_cancel_edit_price(call, user_id, data):
+    show_country_management(call.message.chat.id)
+
+@admin_only
+def _handle_admin_coupon_menu(call, user_id, data):
+    bot.answer_callback_query(call.id, "🎟 Coupon Management")
+    show_coupon_management(call.message.chat.id, call.message.message_id)
+
+@admin_only
+def _handle_admin_create_coupon(call, user_id, data):
+    bot.answer_callback_query(call.id, "Creating coupon...")
+    coupon_state[user_id] = {"step": "ask_code"}
+    edit_or_resend(
+        call.message.chat.id,
+        call.message.message_id,
+        "🎟 **Create Coupon**\n\nEnter coupon code:",
+        markup=_CANCEL_COUPON_MARKUP,
+        parse_mode="Markdown"
+    )
+
+@admin_only
+def _handle_admin_remove_coupon(call, user_id, data):
+    bot.answer_callback_query(call.id, "Removing coupon...")
+    coupon_state[user_id] = {"step": "ask_remove_code"}
+    edit_or_resend(
+        call.message.chat.id,
+        call.message.message_id,
+        "🗑 **Remove Coupon**\n\nEnter coupon code to remove:",
+        markup=_CANCEL_COUPON_MARKUP,
+        parse_mode="Markdown"
+    )
+
+@admin_only
+def _handle_admin_coupon_status(call, user_id, data):
+    bot.answer_callback_query(call.id, "Checking coupon status...")
+    coupon_state[user_id] = {"step": "ask_status_code"}
+    edit_or_resend(
+        call.message.chat.id,
+        call.message.message_id,
+        "📊 **Coupon Status**\n\nEnter coupon code to check:",
+        markup=_CANCEL_COUPON_MARKUP,
+        parse_mode="Markdown"
+    )
+
+@admin_only
+def _handle_broadcast_menu(call, user_id, data):
+    bot.answer_callback_query(call.id, "📢 Reply any photo / document / video / text with /sendbroadcast")
+    bot.send_message(call.message.chat.id, "📢 **Broadcast Instructions**\n\nReply to any message (photo / document / video / text) with /sendbroadcast\n\n✅ The message will be forwarded as-is to all users.")
+
+@admin_only
+def _handle_refund_start(call, user_id, data):
+    bot.answer_callback_query(call.id, "Processing...")
+    msg = bot.send_message(call.message.chat.id, "💸 Enter user ID for refund:")
+    bot.register_next_step_handler(msg, ask_refund_user)
+
+@admin_only
+def _handle_ranking(call, user_id, data):
+    bot.answer_callback_query(call.id, "📊 Generating ranking...")
+    show_user_ranking(call.message.chat.id)
+
+@admin_only
+def _handle_message_user(call, user_id, data):
+    bot.answer_callback_query(call.id, "👤 Enter user ID to send message:")
+    msg = bot.send_message(call.message.chat.id, "👤 Enter user ID to send message:")
+    bot.register_next_step_handler(msg, ask_message_content)
+
+@admin_only
+def _handle_admin_deduct_start(call, user_id, data):
+    bot.answer_callback_query(call.id, "Processing...")
+    admin_deduct_state[user_id] = {"step": "ask_user_id"}
+    msg = bot.send_message(call.message.chat.id, "👤 Enter User ID whose balance you want to deduct:")
+    broadcast_data.pop(user_id, None)
+
+@admin_only
+def _handle_ban_user(call, user_id, data):
+    bot.answer_callback_query(call.id, "Processing...")
+    msg = bot.send_message(call.message.chat.id, "🚫 Enter User ID to ban:")
+    bot.register_next_step_handler(msg, ask_ban_user)
+
+@admin_only
+def _handle_unban_user(call, user_id, data):
+    bot.answer_callback_query(call.id, "Processing...")
+    msg = bot.send_message(call.message.chat.id, "✅ Enter User ID to unban:")
+    bot.register_next_step_handler(msg, ask_unban_user)
+
+@admin_only
+def _handle_manage_countries(call, user_id, data):
+    bot.answer_callback_query(call.id, "Processing...")
+    show_country_management(call.message.chat.id)
+
+@admin_only
+def _handle_add_country(call, user_id, data):
+    bot.answer_callback_query(call.id, "Processing...")
+    msg = bot.send_message(call.message.chat.id, "🌍 Enter country name to add:")
+    bot.register_next_step_handler(msg, ask_country_name)
+
+@admin_only
+def _handle_remove_country(call, user_id, data):
+    bot.answer_callback_query(call.id, "Processing...")
+    show_country_removal(call.message.chat.id)
+
+@admin_only
+def _handle_remove_country_selected(call, user_id, data):
+    country_name = data.split("_", 2)[2]
+    result = remove_country(country_name, call.message.chat.id, call.message.message_id)
+    bot.answer_callback_query(call.id, result, show_alert=True)
+
+# Exact callback data -> handler, checked before the prefixes
+CALLBACK_HANDLERS = {
+    "verify_join": _handle_verify_join,
+    "buy_account": _handle_buy_account,
+    "balance": _handle_balance,
+    "send_balance_menu": _handle_send_balance_menu,
+    "transfer_confirm": _handle_transfer_confirm,
+    "transfer_execute": _handle_transfer_execute,
+    "redeem_coupon": _handle_redeem_coupon,
+    "recharge": _handle_recharge,
+    "refer_friends": _handle_refer_friends,
+    "support": _handle_support,
+    "admin_panel": _handle_admin_panel,
+    "start_bulk_add": _handle_start_bulk_add,
+    "cancel_bulk": _handle_cancel_bulk,
+    "pause_bulk": _handle_pause_bulk,
+    "resume_bulk": _handle_resume_bulk,
+    "skip_bulk_number": _handle_skip_bulk_number,
+    "back_to_countries": _handle_back_to_countries,
+    "back_to_menu": _handle_back_to_menu,
+    "recharge_upi": _handle_recharge_upi,
+    "recharge_crypto": _handle_recharge_crypto,
+    "upi_deposited": _handle_upi_deposited,
+    "add_account": _handle_add_account,
+    "cancel_login": _handle_cancel_login,
+    "out_of_stock": _handle_out_of_stock,
+    "edit_price": _handle_edit_price,
+    "cancel_edit_price": _handle_cancel_edit_price,
+    "admin_coupon_menu": _handle_admin_coupon_menu,
+    "admin_create_coupon": _handle_admin_create_coupon,
+    "admin_remove_coupon": _handle_admin_remove_coupon,
+    "admin_coupon_status": _handle_admin_coupon_status,
+    "broadcast_menu": _handle_broadcast_menu,
+    "refund_start": _handle_refund_start,
+    "ranking": _handle_ranking,
+    "message_user": _handle_message_user,
+    "admin_deduct_start": _handle_admin_deduct_start,
+    "ban_user": _handle_ban_user,
+    "unban_user": _handle_unban_user,
+    "manage_countries": _handle_manage_countries,
+    "add_country": _handle_add_country,
+    "remove_country": _handle_remove_country
+}
+
+# Callback data prefix -> handler, first match wins
+CALLBACK_PREFIX_HANDLERS = (
+    ("bulk_account_", _handle_bulk_account),
+    ("single_account_", _handle_single_account),
+    ("country_raw_", _handle_country_raw),
+    ("buy_", _handle_buy),
+    ("logout_session_", _handle_logout_session),
+    ("get_otp_", _handle_get_otp),
+    ("approve_rech|", _handle_recharge_decision),
+    ("cancel_rech|", _handle_recharge_decision),
+    ("login_country_", _handle_login_country),
+    ("edit_price_country_", _handle_edit_price_country),
+    ("edit_price_confirm_", _handle_edit_price_confirm),
+    ("remove_country_", _handle_remove_country_selected)
+)
+
+def get_callback_handler(data):
+    """Find the handler for a callback, one dict probe for exact matches"""
+    handler = CALLBACK_HANDLERS.get(data)
+    if handler is None:
+        for prefix, prefix_handler in CALLBACK_PREFIX_HANDLERS:
+            if data.startswith(prefix):
+                return prefix_handler
+    return handler
+
+@bot.callback_query_handler(func=lambda call: True)
+@per_user
+def handle_callbacks(call):
+    user_id = call.from_user.id
+    data = call.data
+    
+    if is_user_banned(user_id):
+        bot.answer_callback_query(call.id, "🚫 Your account is banned", show_alert=True)
+        return
+    
+    logger.info(f"Callback received: {data} from user {user_id}")
+    
+    try:
+        handler = get_callback_handler(data)
+        if handler is None:
             bot.answer_callback_query(call.id, "❌ Unknown action", show_alert=True)
+        else:
+            handler(call, user_id, data)
     
     except Exception as e:
         logger.error(f"Callback error: {e}")
@@ -1637,10 +2039,9 @@ def handle_cancel_bulk(call):
         state = bulk_add_states[user_id]
         
         if state.get("current_client") and account_manager:
-            try:
-                asyncio.run(account_manager.pyrogram_manager.safe_disconnect(state["current_client"]))
-            except:
-                pass
+            account_manager.disconnect_client_background(state["current_client"])
+        if account_manager:
+            drop_prefetched_codes(state)
         
         del bulk_add_states[user_id]
     
@@ -1668,10 +2069,15 @@ def handle_bulk_numbers_input(msg):
     
     valid_numbers = []
     invalid_numbers = []
+    duplicate_count = 0
     
     for line in lines[:50]:
-        if re.match(r'^\+\d{10,15}$', line):
-            valid_numbers.append(line)
+        if _PHONE_RE.match(line):
+            # A repeated number would get a second code while the first is being entered
+            if line in valid_numbers:
+                duplicate_count += 1
+            else:
+                valid_numbers.append(line)
         else:
             invalid_numbers.append(line)
     
@@ -1688,21 +2094,27 @@ def handle_bulk_numbers_input(msg):
     state["total_numbers"] = len(valid_numbers)
     state["step"] = "confirm_numbers"
     
-    message = f"📦 **Bulk Account Addition**\n\n"
-    message += f"🌍 Country: {state['country']}\n"
-    message += f"📱 Total Numbers: {len(valid_numbers)}\n"
+    parts = [
+        "📦 **Bulk Account Addition**",
+        "",
+        f"🌍 Country: {state['country']}",
+        f"📱 Total Numbers: {len(valid_numbers)}",
+    ]
     
     if invalid_numbers:
-        message += f"⚠️ Invalid (skipped): {len(invalid_numbers)}\n"
+        parts.append(f"⚠️ Invalid (skipped): {len(invalid_numbers)}")
     
-    message += f"\n**First 5 numbers:**\n"
-    for i, num in enumerate(valid_numbers[:5], 1):
-        message += f"{i}. `{num}`\n"
+    if duplicate_count:
+        parts.append(f"🔁 Duplicates (skipped): {duplicate_count}")
+    
+    parts.extend(["", "**First 5 numbers:**"])
+    parts.extend(f"{i}. `{num}`" for i, num in enumerate(valid_numbers[:5], 1))
     
     if len(valid_numbers) > 5:
-        message += f"... and {len(valid_numbers) - 5} more\n"
+        parts.append(f"... and {len(valid_numbers) - 5} more")
     
-    message += f"\nClick below to start adding accounts:"
+    parts.extend(["", "Click below to start adding accounts:"])
+    message = "\n".join(parts)
     
     markup = InlineKeyboardMarkup(row_width=2)
     markup.add(
@@ -1729,14 +2141,49 @@ def start_bulk_processing(user_id):
         f"🌍 Country: {state['country']}\n"
         f"📱 Total: {state['total_numbers']} numbers\n"
         f"⏳ Processing first number...",
-        markup=InlineKeyboardMarkup().add(
-            InlineKeyboardButton("⏸️ Pause", callback_data="pause_bulk"),
-            InlineKeyboardButton("❌ Cancel", callback_data="cancel_bulk")
-        )
+        markup=_BULK_PAUSE_MARKUP
     )
     
     process_next_bulk_number(user_id)
 
+# Progress edits closer together than this are dropped, a run of quick
+# failures would otherwise edit the same message several times a second
+BULK_PROGRESS_EDIT_INTERVAL = 2.0
+
+def edit_bulk_progress(state, text, markup):
+    """Edit the bulk progress message unless it was edited moments ago"""
+    now = time.monotonic()
+    if now - state.get("last_edit_ts", 0.0) < BULK_PROGRESS_EDIT_INTERVAL:
+        return
+    state["last_edit_ts"] = now
+    edit_or_resend(state["chat_id"], state["message_id"], text, markup=markup)
+
+# Numbers past the current one whose OTP is already being requested, so
+# the admin doesn't wait a send-code round trip between numbers
+BULK_PREFETCH = 3
+
+def prefetch_bulk_codes(state):
+    """Request OTPs for the next few numbers in the background"""
+    prefetched = state.setdefault("prefetched", {})
+    start_index = state["current_index"] + 1
+    for phone in state["phone_numbers"][start_index:start_index + BULK_PREFETCH]:
+        # Never resend to the number whose code is being entered now
+        if phone != state.get("current_phone") and phone not in prefetched:
+            prefetched[phone] = account_manager.bulk_send_code_background(phone)
+
+def _disconnect_prefetched(future):
+    try:
+        client = future.result().get("client")
+    except Exception:
+        return
+    if client:
+        account_manager.disconnect_client_background(client)
+
+def drop_prefetched_codes(state):
+    """Disconnect the clients of OTP requests that will never be used"""
+    for future in state.pop("prefetched", {}).values():
+        future.add_done_callback(_disconnect_prefetched)
+
 def process_next_bulk_number(user_id):
     if user_id not in bulk_add_states:
         return
@@ -1758,20 +2205,15 @@ def process_next_bulk_number(user_id):
     total = state["total_numbers"]
     percentage = (progress / total) * 100
     
-    edit_or_resend(
-        state["chat_id"],
-        state["message_id"],
+    edit_bulk_progress(
+        state,
         f"🔄 **Processing Number {progress}/{total}**\n\n"
         f"📱 Phone: `{phone_number}`\n"
         f"📊 Progress: {progress}/{total} ({percentage:.1f}%)\n"
         f"✅ Success: {state['success_count']}\n"
         f"❌ Failed: {state['failed_count']}\n\n"
         f"⏳ Sending OTP...",
-        markup=InlineKeyboardMarkup().add(
-            InlineKeyboardButton("⏸️ Pause", callback_data="pause_bulk"),
-            InlineKeyboardButton("⏭️ Skip", callback_data="skip_bulk_number"),
-            InlineKeyboardButton("❌ Cancel", callback_data="cancel_bulk")
-        )
+        markup=_BULK_PROGRESS_MARKUP
     )
     
     send_bulk_otp(user_id, phone_number)
@@ -1784,7 +2226,15 @@ def send_bulk_otp(user_id, phone_number):
         
         state = bulk_add_states[user_id]
         
-        result = account_manager.bulk_send_code_sync(phone_number)
+        future = state.get("prefetched", {}).pop(phone_number, None)
+        if future:
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"success": False, "error": str(e), "client": None}
+        else:
+            result = account_manager.bulk_send_code_sync(phone_number)
+        prefetch_bulk_codes(state)
         
         if result.get("success"):
             state["current_client"] = result["client"]
@@ -1799,10 +2249,7 @@ def send_bulk_otp(user_id, phone_number):
                 f"✅ OTP sent!\n"
                 f"Please enter the OTP received for this number:\n\n"
                 f"_(Type 'skip' to skip this number)_",
-                markup=InlineKeyboardMarkup().add(
-                    InlineKeyboardButton("⏭️ Skip This Number", callback_data="skip_bulk_number"),
-                    InlineKeyboardButton("❌ Cancel", callback_data="cancel_bulk")
-                )
+                markup=_BULK_SKIP_MARKUP
             )
         else:
             error_msg = result.get("error", "Unknown error")
@@ -1824,10 +2271,7 @@ def bulk_number_failed(user_id, reason):
     })
     
     if state.get("current_client") and account_manager:
-        try:
-            asyncio.run(account_manager.pyrogram_manager.safe_disconnect(state["current_client"]))
-        except:
-            pass
+        account_manager.disconnect_client_background(state["current_client"])
     
     state["current_index"] += 1
     state["password_attempts"] = 0
@@ -1841,10 +2285,7 @@ def bulk_number_success(user_id):
     state["success_count"] += 1
     
     if state.get("current_client") and account_manager:
-        try:
-            asyncio.run(account_manager.pyrogram_manager.safe_disconnect(state["current_client"]))
-        except:
-            pass
+        account_manager.disconnect_client_background(state["current_client"])
     
     state["current_index"] += 1
     state["password_attempts"] = 0
@@ -1897,10 +2338,7 @@ def handle_bulk_otp_input(msg):
                 f"🔐 2FA Password required!\n"
                 f"Enter your 2-step verification password:\n\n"
                 f"_(Type 'skip' to skip this number)_",
-                markup=InlineKeyboardMarkup().add(
-                    InlineKeyboardButton("⏭️ Skip This Number", callback_data="skip_bulk_number"),
-                    InlineKeyboardButton("❌ Cancel", callback_data="cancel_bulk")
-                )
+                markup=_BULK_SKIP_MARKUP
             )
         
         else:
@@ -1988,9 +2426,8 @@ def save_bulk_account(user_id, password=None):
             progress = state["current_index"] + 1
             total = state["total_numbers"]
             
-            edit_or_resend(
-                state["chat_id"],
-                state["message_id"],
+            edit_bulk_progress(
+                state,
                 f"✅ **Number {progress}/{total} Added Successfully!**\n\n"
                 f"📱 Phone: `{state['current_phone']}`\n"
                 f"🌍 Country: {state['country']}\n"
@@ -1999,10 +2436,7 @@ def save_bulk_account(user_id, password=None):
                 f"✅ Success: {state['success_count'] + 1}\n"
                 f"❌ Failed: {state['failed_count']}\n\n"
                 f"⏳ Moving to next number...",
-                markup=InlineKeyboardMarkup().add(
-                    InlineKeyboardButton("⏸️ Pause", callback_data="pause_bulk"),
-                    InlineKeyboardButton("❌ Cancel", callback_data="cancel_bulk")
-                )
+                markup=_BULK_PAUSE_MARKUP
             )
             
             bulk_number_success(user_id)
@@ -2020,24 +2454,30 @@ def show_bulk_summary(user_id):
     
     state = bulk_add_states[user_id]
     
-    summary = f"📊 **Bulk Processing Complete!**\n\n"
-    summary += f"🌍 Country: {state['country']}\n"
-    summary += f"📱 Total Numbers: {state['total_numbers']}\n"
-    summary += f"✅ Successfully Added: {state['success_count']}\n"
-    summary += f"❌ Failed/Skipped: {state['failed_count']}\n\n"
+    parts = [
+        "📊 **Bulk Processing Complete!**",
+        "",
+        f"🌍 Country: {state['country']}",
+        f"📱 Total Numbers: {state['total_numbers']}",
+        f"✅ Successfully Added: {state['success_count']}",
+        f"❌ Failed/Skipped: {state['failed_count']}",
+        "",
+    ]
     
     if state['failed_numbers']:
-        summary += f"**Failed Numbers:**\n"
-        for i, failed in enumerate(state['failed_numbers'][:10], 1):
-            summary += f"{i}. {failed['number']} - {failed['reason']}\n"
+        parts.append("**Failed Numbers:**")
+        parts.extend(
+            f"{i}. {failed['number']} - {failed['reason']}"
+            for i, failed in enumerate(state['failed_numbers'][:10], 1)
+        )
         
         if len(state['failed_numbers']) > 10:
-            summary += f"... and {len(state['failed_numbers']) - 10} more\n"
+            parts.append(f"... and {len(state['failed_numbers']) - 10} more")
     
-    summary += f"\n⏰ Completed at: {datetime.utcnow().strftime('%H:%M:%S')}"
+    parts.extend(["", f"⏰ Completed at: {datetime.utcnow().strftime('%H:%M:%S')}"])
+    summary = "\n".join(parts)
     
-    markup = InlineKeyboardMarkup()
-    markup.add(InlineKeyboardButton("🏠 Admin Panel", callback_data="admin_panel"))
+    markup = _ADMIN_PANEL_BUTTON_MARKUP
     
     edit_or_resend(
         state["chat_id"],
@@ -2046,6 +2486,8 @@ def show_bulk_summary(user_id):
         markup=markup
     )
     
+    if account_manager:
+        drop_prefetched_codes(state)
     del bulk_add_states[user_id]
 
 # ---------------------------------------------------------------------
@@ -2059,7 +2501,7 @@ def handle_login_country_selection(call):
         bot.answer_callback_query(call.id, "❌ Session expired", show_alert=True)
         return
     
-    country_name = call.data.replace("login_country_", "")
+    country_name = call.data.removeprefix("login_country_")
     
     login_states[user_id]["country"] = country_name
     
@@ -2082,14 +2524,9 @@ def handle_cancel_login(call):
     user_id = call.from_user.id
     
     if user_id in login_states:
-        state = login_states[user_id]
-        if "client" in state:
-            try:
-                if account_manager and account_manager.pyrogram_manager:
-                    import asyncio
-                    asyncio.run(account_manager.pyrogram_manager.safe_disconnect(state["client"]))
-            except:
-                pass
+        if account_manager:
+            # Disconnects the pending login client on the account loop
+            account_manager.cancel_login_sync(login_states, user_id)
         login_states.pop(user_id, None)
     
     edit_or_resend(
@@ -2117,8 +2554,7 @@ def handle_logout_session(user_id, session_id, chat_id, callback_id):
             except:
                 pass
             
-            markup = InlineKeyboardMarkup()
-            markup.add(InlineKeyboardButton("🏠 Main Menu", callback_data="back_to_menu"))
+            markup = _MAIN_MENU_BUTTON_MARKUP
             
             sent_msg = bot.send_message(
                 chat_id,
@@ -2137,7 +2573,10 @@ def handle_logout_session(user_id, session_id, chat_id, callback_id):
 
 def get_latest_otp(user_id, session_id, chat_id, callback_id):
     try:
-        session_data = otp_sessions_col.find_one({"session_id": session_id})
+        session_data = otp_sessions_col.find_one(
+            {"session_id": session_id},
+            {"session_string": 1, "phone": 1, "account_id": 1, "_id": 0}
+        )
         if not session_data:
             bot.answer_callback_query(callback_id, "❌ Session not found", show_alert=True)
             return
@@ -2169,8 +2608,7 @@ def get_latest_otp(user_id, session_id, chat_id, callback_id):
         )
         
         try:
-            from logs import log_otp_received_async
-            order = orders_col.find_one({"session_id": session_id})
+            order = orders_col.find_one({"session_id": session_id}, {"country": 1, "price": 1, "_id": 0})
             if order:
                 log_otp_received_async(
                     user_id=user_id,
@@ -2187,7 +2625,7 @@ def get_latest_otp(user_id, session_id, chat_id, callback_id):
         two_step_password = ""
         if account_id:
             try:
-                account = accounts_col.find_one({"_id": ObjectId(account_id)})
+                account = accounts_col.find_one({"_id": ObjectId(account_id)}, {"two_step_password": 1, "_id": 0})
                 if account:
                     two_step_password = account.get("two_step_password", "")
             except:
@@ -2287,8 +2725,7 @@ def handle_coupon_input(msg):
         text += f"💳 New Balance: {format_currency(new_balance)}\n\n"
         text += f"Thank you for using our service! 🎉"
         
-        markup = InlineKeyboardMarkup()
-        markup.add(InlineKeyboardButton("🏠 Main Menu", callback_data="back_to_menu"))
+        markup = _MAIN_MENU_BUTTON_MARKUP
         
         sent_msg = bot.send_message(
             msg.chat.id,
@@ -2318,8 +2755,7 @@ def handle_coupon_input(msg):
         else:
             response = f"❌ **Error:** {error_msg}"
         
-        markup = InlineKeyboardMarkup()
-        markup.add(InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu"))
+        markup = _BACK_TO_MENU_MARKUP
         
         sent_msg = bot.send_message(
             msg.chat.id,
@@ -2346,7 +2782,7 @@ def handle_coupon_code_input(msg):
         bot.send_message(msg.chat.id, "❌ Coupon code cannot be empty. Enter coupon code:")
         return
     
-    existing = get_coupon(code)
+    existing = get_coupon(code, {"_id": 1})
     if existing:
         bot.send_message(
             msg.chat.id,
@@ -2428,8 +2864,7 @@ def handle_coupon_max_users_input(msg):
             text += f"👥 Max Users: {max_users}\n\n"
             text += f"Coupon is now active and ready for users to redeem."
             
-            markup = InlineKeyboardMarkup()
-            markup.add(InlineKeyboardButton("🎟 Coupon Management", callback_data="admin_coupon_menu"))
+            markup = _COUPON_MENU_MARKUP
             
             bot.send_message(
                 msg.chat.id,
@@ -2470,8 +2905,7 @@ def handle_coupon_remove_input(msg):
         text += f"🚫 Status: Removed\n\n"
         text += f"This coupon can no longer be claimed by users."
         
-        markup = InlineKeyboardMarkup()
-        markup.add(InlineKeyboardButton("🎟 Coupon Management", callback_data="admin_coupon_menu"))
+        markup = _COUPON_MENU_MARKUP
         
         bot.send_message(
             msg.chat.id,
@@ -2487,8 +2921,7 @@ def handle_coupon_remove_input(msg):
         else:
             response = f"❌ **Error:** {message}"
         
-        markup = InlineKeyboardMarkup()
-        markup.add(InlineKeyboardButton("🎟 Coupon Management", callback_data="admin_coupon_menu"))
+        markup = _COUPON_MENU_MARKUP
         
         bot.send_message(
             msg.chat.id,
@@ -2542,8 +2975,7 @@ def handle_coupon_status_input(msg):
             for i, uid in enumerate(status['claimed_users'][:10], 1):
                 text += f"{i}. User ID: {uid}\n"
     
-    markup = InlineKeyboardMarkup()
-    markup.add(InlineKeyboardButton("🎟 Coupon Management", callback_data="admin_coupon_menu"))
+    markup = _COUPON_MENU_MARKUP
     
     bot.send_message(
         msg.chat.id,
@@ -2684,7 +3116,8 @@ def handle_screenshot_input(msg):
         utr = upi_payment_states[user_id].get("utr", "")
         
         # Generate unique request ID
-        req_id = f"R{int(time.time())}{user_id}"
+        # req_id is unique, a timestamp and user id could repeat within a second
+        req_id = f"R{ObjectId()}"
         
         # Save to database with proper fields
         recharge_data = {
@@ -2765,7 +3198,7 @@ def handle_receiver_id(msg):
         receiver_id = int(msg.text.strip())
         
         # Check if receiver exists in database
-        receiver = users_col.find_one({"user_id": receiver_id})
+        receiver = users_col.find_one({"user_id": receiver_id}, {"_id": 1})
         if not receiver:
             bot.send_message(
                 msg.chat.id,
@@ -2997,7 +3430,7 @@ def handle_login_flow_messages(msg):
     
     if step == "phone":
         phone = msg.text.strip()
-        if not re.match(r'^\+\d{10,15}$', phone):
+        if not _PHONE_RE.match(phone):
             bot.send_message(chat_id, "❌ Invalid phone number format. Please enter with country code:\nExample: +919876543210")
             return
         
@@ -3023,9 +3456,7 @@ def handle_login_flow_messages(msg):
                         f"📱 Phone: {phone}\n\n"
                         "📩 OTP sent! Enter the OTP you received:",
                         chat_id, message_id,
-                        reply_markup=InlineKeyboardMarkup().add(
-                            InlineKeyboardButton("❌ Cancel", callback_data="cancel_login")
-                        )
+                        reply_markup=_CANCEL_LOGIN_MARKUP
                     )
                 except:
                     pass
@@ -3095,9 +3526,7 @@ def handle_login_flow_messages(msg):
                         "🔐 2FA Password required!\n"
                         "Enter your 2-step verification password:",
                         chat_id, message_id,
-                        reply_markup=InlineKeyboardMarkup().add(
-                            InlineKeyboardButton("❌ Cancel", callback_data="cancel_login")
-                        )
+                        reply_markup=_CANCEL_LOGIN_MARKUP
                     )
                 except:
                     pass
@@ -3237,7 +3666,10 @@ def handle_edit_price_input(msg):
 # ---------------------------------------------------------------------
 
 def show_referral_info(user_id, chat_id):
-    user_data = users_col.find_one({"user_id": user_id}) or {}
+    user_data = users_col.find_one(
+        {"user_id": user_id},
+        {"referral_code": 1, "total_commission_earned": 1, "total_referrals": 1}
+    ) or {}
     referral_code = user_data.get('referral_code', f'REF{user_id}')
     total_commission = user_data.get('total_commission_earned', 0)
     total_referrals = user_data.get('total_referrals', 0)
@@ -3453,7 +3885,7 @@ def ask_ban_user(message):
     try:
         user_id_to_ban = int(message.text.strip())
         
-        user = users_col.find_one({"user_id": user_id_to_ban})
+        user = users_col.find_one({"user_id": user_id_to_ban}, {"_id": 1})
         if not user:
             bot.send_message(message.chat.id, "❌ User not found in database.")
             return
@@ -3471,6 +3903,7 @@ def ask_ban_user(message):
             "banned_at": datetime.utcnow()
         }
         banned_users_col.insert_one(ban_record)
+        invalidate_ban(user_id_to_ban)
         
         bot.send_message(message.chat.id, f"✅ User {user_id_to_ban} has been banned.")
         
@@ -3503,6 +3936,7 @@ def ask_unban_user(message):
             {"user_id": user_id_to_unban, "status": "active"},
             {"$set": {"status": "unbanned", "unbanned_at": datetime.utcnow(), "unbanned_by": message.from_user.id}}
         )
+        invalidate_ban(user_id_to_unban)
         
         bot.send_message(message.chat.id, f"✅ User {user_id_to_unban} has been unbanned.")
         
@@ -3525,14 +3959,14 @@ def show_user_ranking(chat_id):
     
     try:
         users_ranking = []
-        all_wallets = wallets_col.find()
+        all_wallets = wallets_col.find({}, {"user_id": 1, "balance": 1, "_id": 0})
         
         for wallet in all_wallets:
             user_id_rank = wallet.get("user_id")
             balance = float(wallet.get("balance", 0))
             
             if balance > 0:
-                user = users_col.find_one({"user_id": user_id_rank}) or {}
+                user = users_col.find_one({"user_id": user_id_rank}, {"name": 1, "username": 1}) or {}
                 name = user.get("name", "Unknown")
                 username_db = user.get("username")
                 users_ranking.append({
@@ -3809,7 +4243,7 @@ def ask_refund_user(message):
 def process_refund(message, refund_user_id):
     try:
         amount = float(message.text)
-        user = users_col.find_one({"user_id": refund_user_id})
+        user = users_col.find_one({"user_id": refund_user_id}, {"_id": 1})
         
         if not user:
             bot.send_message(message.chat.id, "⚠️ User not found in database.")
@@ -3840,7 +4274,7 @@ def process_refund(message, refund_user_id):
 def ask_message_content(msg):
     try:
         target_user_id = int(msg.text)
-        user_exists = users_col.find_one({"user_id": target_user_id})
+        user_exists = users_col.find_one({"user_id": target_user_id}, {"_id": 1})
         if not user_exists:
             bot.send_message(msg.chat.id, "❌ User not found in database.")
             return
@@ -3885,8 +4319,7 @@ def show_countries(chat_id):
     countries = get_all_countries()
     if not countries:
         text = "🌍 **Select Country**\n\n❌ No countries available right now. Please check back later."
-        markup = InlineKeyboardMarkup()
-        markup.add(InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu"))
+        markup = _BACK_TO_MENU_MARKUP
         
         sent_msg = bot.send_message(chat_id, text, reply_markup=markup, parse_mode="Markdown")
         user_last_message[chat_id] = sent_msg.message_id
@@ -4009,7 +4442,6 @@ def process_purchase(user_id, account_id, chat_id, message_id, callback_id):
         deduct_balance(user_id, price)
         
         try:
-            from logs import log_purchase_async
             log_purchase_async(
                 user_id=user_id,
                 country=account['country'],
@@ -4165,7 +4597,7 @@ def chat_handler(msg):
         if state["step"] == "ask_user_id":
             try:
                 target_user_id = int(msg.text.strip())
-                user_exists = users_col.find_one({"user_id": target_user_id})
+                user_exists = users_col.find_one({"user_id": target_user_id}, {"_id": 1})
                 if not user_exists:
                     bot.send_message(ADMIN_ID, "❌ User not found. Enter valid User ID:")
                     return
@@ -4295,6 +4727,38 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"❌ Failed to create coupon indexes: {e}")
     
+    try:
+        otp_sessions_col.create_index([("session_id", 1)])
+        logger.info("✅ OTP session indexes created")
+    except Exception as e:
+        logger.error(f"❌ Failed to create OTP session indexes: {e}")
+    
+    try:
+        users_col.create_index([("user_id", 1)], unique=True)
+        wallets_col.create_index([("user_id", 1)], unique=True)
+        logger.info("✅ User and wallet indexes created")
+    except Exception as e:
+        logger.error(f"❌ Failed to create user and wallet indexes: {e}")
+    
+    try:
+        banned_users_col.create_index([("user_id", 1), ("status", 1)])
+        accounts_col.create_index([("country", 1), ("status", 1), ("used", 1)])
+        countries_col.create_index([("status", 1), ("name", 1)])
+        countries_col.create_index([("name", 1), ("status", 1)], collation=COUNTRY_NAME_COLLATION)
+        referrals_col.create_index([("referred_id", 1), ("referrer_id", 1)])
+        orders_col.create_index([("session_id", 1)])
+        recharges_col.create_index([("req_id", 1)], unique=True)
+        logger.info("✅ Lookup indexes created")
+    except Exception as e:
+        logger.error(f"❌ Failed to create lookup indexes: {e}")
+    
+    try:
+        # Keep one year of transaction history
+        transactions_col.create_index([("timestamp", 1)], expireAfterSeconds=60 * 60 * 24 * 365)
+        logger.info("✅ Transaction TTL index created")
+    except Exception as e:
+        logger.error(f"❌ Failed to create transaction TTL index: {e}")
+    
     try:
         bot.infinity_polling(timeout=60, long_polling_timeout=60)
     except Exception as e:
@@ -8,9 +8,16 @@ import time
 from datetime import datetime
 from typing import Optional, Dict, Any
 import threading
+import queue
 
 logger = logging.getLogger(__name__)
 
+# Retries for a log message Telegram rejected with 429 Too Many Requests,
+# used only when no shared request sender is already retrying it
+MAX_SEND_RETRIES = 5
+# Telegram allows about one message per second into a single chat
+LOG_MIN_INTERVAL = 1.0
+
 class TelegramLogger:
     """Sends logs to Telegram channel"""
     
@@ -55,18 +62,30 @@ class TelegramLogger:
             logger.error("Telegram bot not initialized")
             return False
         
-        try:
-            # Send message to channel
-            self._bot.send_message(
-                self.log_channel_id,
-                message,
-                parse_mode=parse_mode,
-                disable_web_page_preview=True
-            )
-            return True
-        except Exception as e:
-            logger.error(f"Failed to send log to Telegram: {e}")
-            return False
+        from telebot import apihelper
+        
+        delay = 1.0
+        for attempt in range(MAX_SEND_RETRIES + 1):
+            try:
+                # Send message to channel
+                self._bot.send_message(
+                    self.log_channel_id,
+                    message,
+                    parse_mode=parse_mode,
+                    disable_web_page_preview=True
+                )
+                return True
+            except Exception as e:
+                # A custom request sender (bot.py installs one) has already waited out 429s
+                if (getattr(e, "error_code", None) != 429 or attempt == MAX_SEND_RETRIES
+                        or apihelper.CUSTOM_REQUEST_SENDER is not None):
+                    logger.error(f"Failed to send log to Telegram: {e}")
+                    return False
+                # Flood limited, wait as long as Telegram asks, else back off
+                retry_after = (getattr(e, "result_json", None) or {}).get("parameters", {}).get("retry_after")
+                time.sleep(retry_after or delay)
+                delay = min(delay * 2, 60)
+        return False
     
     def log_purchase(self, user_id: int, country: str, price: float, phone: str) -> bool:
         """
@@ -199,41 +218,55 @@ def get_logger() -> TelegramLogger:
     return telegram_logger
 
 # Helper functions for common logging scenarios
-def log_purchase_async(user_id: int, country: str, price: float, phone: str):
-    """Log purchase in background thread"""
-    def _log():
+
+# Pending log sends, drained by one worker thread so handlers never wait
+# on the log channel and bursts can't open a thread each
+_log_queue = queue.Queue(maxsize=10000)
+_log_worker = None
+_log_worker_lock = threading.Lock()
+
+def _log_worker_loop():
+    """Send queued logs one at a time, paced for the channel's rate limit"""
+    while True:
+        send, args, what = _log_queue.get()
+        started = time.monotonic()
         try:
-            logger = get_logger()
-            logger.log_purchase(user_id, country, price, phone)
+            send(get_logger(), *args)
         except Exception as e:
-            logging.error(f"Failed to log purchase: {e}")
-    
-    thread = threading.Thread(target=_log, daemon=True)
-    thread.start()
+            logging.error(f"Failed to log {what}: {e}")
+        elapsed = time.monotonic() - started
+        if elapsed < LOG_MIN_INTERVAL:
+            time.sleep(LOG_MIN_INTERVAL - elapsed)
+
+def _enqueue_log(send, args, what):
+    """Queue a log send, dropping the oldest pending one if the queue is full"""
+    global _log_worker
+    if _log_worker is None:
+        with _log_worker_lock:
+            if _log_worker is None:
+                _log_worker = threading.Thread(target=_log_worker_loop, name="telegram-log", daemon=True)
+                _log_worker.start()
+    while True:
+        try:
+            _log_queue.put_nowait((send, args, what))
+            return
+        except queue.Full:
+            try:
+                _log_queue.get_nowait()
+            except queue.Empty:
+                pass
+
+def log_purchase_async(user_id: int, country: str, price: float, phone: str):
+    """Log purchase in background thread"""
+    _enqueue_log(TelegramLogger.log_purchase, (user_id, country, price, phone), "purchase")
 
 def log_otp_received_async(user_id: int, phone: str, otp_code: str, country: str, price: float):
     """Log OTP receipt in background thread"""
-    def _log():
-        try:
-            logger = get_logger()
-            logger.log_otp_received(user_id, phone, otp_code, country, price)
-        except Exception as e:
-            logging.error(f"Failed to log OTP: {e}")
-    
-    thread = threading.Thread(target=_log, daemon=True)
-    thread.start()
+    _enqueue_log(TelegramLogger.log_otp_received, (user_id, phone, otp_code, country, price), "OTP")
 
 def log_recharge_approved_async(user_id: int, amount: float, method: str = "UPI", utr: str = None):
     """Log recharge approval in background thread"""
-    def _log():
-        try:
-            logger = get_logger()
-            logger.log_recharge_approved(user_id, amount, method, utr)
-        except Exception as e:
-            logging.error(f"Failed to log recharge: {e}")
-    
-    thread = threading.Thread(target=_log, daemon=True)
-    thread.start()
+    _enqueue_log(TelegramLogger.log_recharge_approved, (user_id, amount, method, utr), "recharge")
 
 # Export everything
 __all__ = [